@@ -1,108 +1,253 @@
 from mesa import Agent, Model
-from pydantic import BaseModel, ConfigDict
+from dataclasses import dataclass
 from typing import Tuple, List
 from objects import Waste
+from spatial import TargetIndex, UnknownIndex, TiledMap
 import numpy as np
-import random
 
 COLOR_CODE = {'green':0, 'yellow':1, 'red':2}
 CODE_COLOR =  {v: k for k, v in COLOR_CODE.items()}
-
-class Knowledge(BaseModel):
+MAX_KNOWN_WASTE = 127 # waste counts are stored on int8, only their sign matters for the decisions
+NO_TARGET = np.iinfo(np.int64).max # distance of a target that is not free
+
+def zone_bounds(width, color):
+    """Return the (x_min, x_end) columns delimiting the zone of a given color on a grid of a given width."""
+    if color == "green":
+        return (0, width // 3 - 1)
+    elif color == "yellow":
+        return (width // 3, 2 * width // 3 - 1)
+    elif color == "red":
+        return (2 * width // 3, width - 1)
+    raise ValueError("Invalid radioactivity level. Choose 'green', 'yellow', or 'red'.")
+
+class Blackboard:
+    """Knowledge store shared by the robots that communicate (strategies 2 and 3).
+    Without communication, each robot owns a private one."""
+    __slots__ = ('target_map', 'known_targets', 'unknown', 'available_agents_pos', 'version', 'changes', 'assignments')
+
+    def __init__(self, width, height):
+        self.target_map = TiledMap(width, height) # waste counts per cell and color, -1 is unknown, tiles allocated when observed
+        # indexes kept in sync with target_map for the nearest-cell queries
+        self.known_targets = [TargetIndex(width, height) for _ in COLOR_CODE] # cells with waste, per color
+        self.unknown = UnknownIndex(width, height) # cells never observed
+        self.available_agents_pos = {'green':{}, 'yellow':{}, 'red':{}}
+        self.version = 0 # incremented at each publication
+        self.changes = [[0, 0, 0] for _ in COLOR_CODE] # per color: changes of its known waste, of its available robots, of their positions
+        self.assignments = [None, None, None] # latest TeamAssignment, per team
+
+    def publish(self, percepts):
+        """Writes the percepts of one robot action into the store."""
+        cells, waste = percepts['waste']
+        cells, waste = cells.tolist(), waste.tolist()
+        before = self.target_map.take(cells)
+        if before != waste:
+            # only the cells that changed are written into the indexes
+            height = self.target_map.height
+            for cell, known, seen in zip(cells, before, waste):
+                if known == seen:
+                    continue
+                seen = [min(n, MAX_KNOWN_WASTE) for n in seen]
+                self.target_map.put(cell, seen)
+                x, y = divmod(cell, height)
+                if known[0] < 0:
+                    self.unknown.discard(x, y)
+                for code, n in enumerate(seen):
+                    if n > 0 and known[code] <= 0:
+                        self.known_targets[code].add(x, y)
+                        self.changes[code][0] += 1
+                    elif n == 0 and known[code] > 0:
+                        self.known_targets[code].discard(x, y)
+                        self.changes[code][0] += 1
+        agent, position = percepts['agent']
+        assert isinstance(agent, Robot)
+        
+        if not agent.available:
+            position=None
+        positions = self.available_agents_pos[agent.color]
+        changes = self.changes[COLOR_CODE[agent.color]]
+        if agent.unique_id not in positions or (positions[agent.unique_id] is None) != (position is None):
+            changes[1] += 1
+        elif positions[agent.unique_id] != position:
+            changes[2] += 1
+        positions[agent.unique_id]=position
+        self.version += 1
+
+    def revision(self, color, full=True):
+        """Revision of the knowledge the robots of a color decide on: their known waste, which of them
+        are available and where, and the unknown cells (which only shrink). The knowledge is the same
+        while it is equal. Without full, the positions are left out and only whether unknown cells
+        are left counts, which is enough for a robot with nothing to pick up or explore."""
+        waste, availability, positions = self.changes[COLOR_CODE[color]]
+        if full:
+            return (waste, availability, positions, len(self.unknown))
+        return (waste, availability, None, len(self.unknown) > 0)
+
+    def load(self, keys, tiles):
+        """Replaces the knowledge by the tiles of a map (e.g. restored from a checkpoint, see
+        TiledMap.get_tiles) and rebuilds the indexes from it."""
+        self.target_map.load(keys, tiles)
+        width, height = self.target_map.width, self.target_map.height
+        xs, ys, counts = self.target_map.known()
+        self.known_targets = [TargetIndex.from_cells(width, height, xs[counts[:, code] > 0], ys[counts[:, code] > 0])
+                              for code in COLOR_CODE.values()]
+        self.unknown = UnknownIndex.from_known(width, height, xs, ys)
+        self.changes = [[n + 1 for n in changes] for changes in self.changes]
+        self.assignments = [None, None, None]
+
+    def assignment(self, color, tick):
+        """Target assignment of a team, computed once per tick, and kept for the next ticks while the
+        knowledge of the team does not change."""
+        code = COLOR_CODE[color]
+        cached = self.assignments[code]
+        if cached is None or (cached.tick != tick and cached.revision != self.revision(color)):
+            cached = self.assignments[code] = TeamAssignment(self, color, tick)
+        cached.tick = tick
+        return cached
+
+class TeamAssignment:
+    """Which robot of a team goes to which target, computed once per tick from the team knowledge.
+    A target is not free for a robot when an available teammate heads to it (it is that teammate's
+    nearest target) and is closer, or as close with a greater unique_id."""
+    def __init__(self, board, color, tick):
+        code = COLOR_CODE[color]
+        self.tick = tick
+        self.board = board
+        self.revision = board.revision(color)
+        self.known_targets = board.known_targets[code]
+        self.teammates = {agent_id: position for agent_id, position in board.available_agents_pos[color].items()
+                          if position is not None}
+        self.exploration_claims = {} # x_range -> claims on the unknown cells
+        self.choices = {} # unique_id -> index of the assigned target, -1 if none is free
+
+        # nearest known target of each teammate, then the strongest claim on each target
+        self.targets = np.array(self.known_targets.cells(), dtype=np.int64).reshape(-1, 2)
+        self.claim_distance = np.full(len(self.targets), NO_TARGET)
+        self.claim_id = np.full(len(self.targets), -1)
+        if len(self.targets) == 0 or len(self.teammates) == 0:
+            return
+        ids = np.fromiter(self.teammates.keys(), dtype=np.int64, count=len(self.teammates))
+        positions = np.array(list(self.teammates.values()), dtype=np.int64)
+        distances = np.abs(positions[:, None, 0] - self.targets[None, :, 0]) \
+            + np.abs(positions[:, None, 1] - self.targets[None, :, 1])
+        nearest = np.argmin(distances, axis=1)
+        nearest_distance = distances[np.arange(len(ids)), nearest]
+        order = np.lexsort((-ids, nearest_distance)) # closest first, then greatest unique_id
+        claimed, first = np.unique(nearest[order], return_index=True)
+        self.claim_distance[claimed] = nearest_distance[order][first]
+        self.claim_id[claimed] = ids[order][first]
+
+        # then the nearest free target of every teammate, in one pass
+        free = self.free_distances(distances, ids[:, None])
+        choice = np.argmin(free, axis=1)
+        choice[free[np.arange(len(ids)), choice] == NO_TARGET] = -1
+        self.choices = dict(zip(ids.tolist(), choice.tolist()))
+
+    def free_distances(self, distances, ids):
+        """Distances to the targets, NO_TARGET where a teammate with priority claims them."""
+        blocked = (self.claim_id >= 0) & (self.claim_id != ids) \
+            & ((self.claim_distance < distances)
+               | ((self.claim_distance == distances) & (self.claim_id > ids)))
+        return np.where(blocked, NO_TARGET, distances)
+
+    def target_for(self, robot):
+        """Nearest known target that is free for the robot."""
+        if len(self.targets) == 0:
+            return None
+        choice = self.choices.get(robot.unique_id)
+        if choice is not None and self.teammates[robot.unique_id] == robot.knowledge.position:
+            if choice < 0:
+                return None
+            target = (int(self.targets[choice, 0]), int(self.targets[choice, 1]))
+            if target in self.known_targets:
+                return target
+        # not a teammate at the start of the tick, or its target was picked up meanwhile
+        x, y = robot.knowledge.position
+        distances = self.free_distances(np.abs(self.targets[:, 0] - x) + np.abs(self.targets[:, 1] - y),
+                                        robot.unique_id)
+        while True:
+            i = np.argmin(distances)
+            if distances[i] == NO_TARGET:
+                return None
+            target = (int(self.targets[i, 0]), int(self.targets[i, 1]))
+            if target in self.known_targets:
+                return target
+            distances[i] = NO_TARGET
+
+    def claims(self, x_range):
+        """Strongest claim (distance, unique_id) of the teammates on the unknown cells of the columns
+        x_range, computed at the first request."""
+        claims = self.exploration_claims.get(x_range)
+        if claims is None:
+            claims = {}
+            for agent_id, position in self.teammates.items():
+                target = self.board.unknown.nearest(position, x_range)
+                if target is None:
+                    continue
+                claim = (abs(position[0] - target[0]) + abs(position[1] - target[1]), agent_id)
+                if target not in claims or (claim[0], -claim[1]) < (claims[target][0], -claims[target][1]):
+                    claims[target] = claim
+            self.exploration_claims[x_range] = claims
+        return claims
+
+    def exploratory_target_for(self, robot, x_range):
+        """Nearest unknown cell of the columns x_range that is free for the robot."""
+        unknown = self.board.unknown
+        claims = self.claims(x_range)
+        x, y = robot.knowledge.position
+        tried = set()
+        while True:
+            target = unknown.nearest((x, y), x_range, tried)
+            if target is None or target not in claims:
+                return target
+            distance = abs(target[0] - x) + abs(target[1] - y)
+            claim_distance, claim_id = claims[target]
+            if claim_id == robot.unique_id or claim_distance > distance \
+                    or (claim_distance == distance and claim_id < robot.unique_id):
+                return target
+            tried.add(target)
+
+@dataclass(slots=True)
+class Knowledge:
    position:Tuple[int, int]
-   target_positions:np.ndarray # grid width x grid heigth x 3
+   board:Blackboard # waste seen and teammates availability, shared when robots communicate
    my_zone:Tuple[int, int, int, int] # x_min, x_end, y_min, y_end
    allowed_zone:Tuple[int, int, int, int]
-   available_agents_pos:dict={'green':{}, 'yellow':{}, 'red':{}}
    reset_zone:bool=True
-   model_config = ConfigDict(arbitrary_types_allowed=True)
 
 class Robot(Agent):
     def __init__(self, model:Model, knowledge:Knowledge, color, strategy=3):
       super().__init__(model)
       self.knowledge=knowledge
       self.color=color
-      self.waste_carried=[]
+      self.waste_carried=[] # Waste agents, or their colors when the model stores waste as counts
       self.available=True # is carrying at most one waste of their own color
       self.strategy=strategy
       self.terminated = False
+      self.time_not_working = 0 # steps without acting
+      self.distance_traveled = 0 # cells moved
+      self.waste_handled = 0 # waste picked up
+      self.parked = None # revision of the knowledge when the robot chose to do nothing, see asleep()
 
     #  allows the agent to get information from the environment.
     def update(self, percepts):
-        """Collects information from the environment."""
-        for position, contents in percepts['waste'].items():
-            x,y=position
-            waste = [0,0,0]
-            for agent_color in contents:
-                waste[COLOR_CODE[agent_color]]+=1
-            self.knowledge.target_positions[x, y, :] = waste
-        agent, position = percepts['agent']
-        assert isinstance(agent, Robot)
-        
-        if not agent.available:
-            position=None
-        agent_id = agent.unique_id
-        self.knowledge.available_agents_pos[agent.color][agent_id]=position
+        """Collects information from the environment and publishes it to the team."""
+        self.knowledge.board.publish(percepts)
           
     def is_at_limit(self):
-        """Check if the agent is at the limit of its zone."""
+        """Check if the agent is at the limit of its zone: the next cell on the right is in another zone."""
         x,y=self.knowledge.position
-        x_min, x_end, y_min, y_end = self.knowledge.my_zone
-        return x==x_end
+        if self.model.zone_of((x, y))!=self.color:
+            return False
+        return x==self.model.width-1 or self.model.zone_of((x+1, y))!=self.color
     
-    def target_is_free(self, nearest_target, distance_self, target_positions):
-        """Check if the target is free."""
-        for agent_id, position in self.knowledge.available_agents_pos[self.color].items():
-            if position is None: # The agent is not available
-                continue
-            distance_other_agent =np.abs(position[0] - nearest_target[0])\
-                + np.abs(position[1] - nearest_target[1])
-            if (distance_self>distance_other_agent) \
-                or (distance_self==distance_other_agent and self.unique_id<agent_id) :
-                # The agent has priority on the waste, but he might be focused on something else
-                distances = np.abs(target_positions[:, 0] - position[0]) + np.abs(target_positions[:, 1] - position[1])
-                i=np.argmin(distances)
-                if (nearest_target == target_positions[i]).all():
-                    return False
-        return True
-
     def get_assigned_target(self):
        """Get the assigned target for the agent."""
-       x,y = self.knowledge.position
-       color_code = COLOR_CODE[self.color]
-       targets = self.knowledge.target_positions[:,:,color_code]
-
-       target_positions_arr = np.argwhere(targets > 0)
-       
-       distances = list(np.abs(target_positions_arr[:, 0] - x) + np.abs(target_positions_arr[:, 1] - y))
-       target_positions = list(target_positions_arr)
-       while len(distances)>0:
-           i=np.argmin(distances)
-           nearest_target = target_positions[i]
-           if self.target_is_free(nearest_target, distances[i], target_positions_arr):
-               return nearest_target
-           distances.pop(i)
-           target_positions.pop(i)
-       return None
+       return self.knowledge.board.assignment(self.color, self.model.steps).target_for(self)
     
     def get_exploratory_target(self):
         """Get the exploratory target for the agent."""
-        x,y = self.knowledge.position
-        color_code = COLOR_CODE[self.color]
         x_min, x_end, y_min, y_end=self.knowledge.my_zone
-        targets = self.knowledge.target_positions[x_min:x_end+1,:,color_code]
-        target_positions_arr = np.argwhere(targets < 0)
-        distances = list(np.abs(target_positions_arr[:, 0] - x) + np.abs(target_positions_arr[:, 1] - y))
-        target_positions=list(target_positions_arr)
-
-        while len(distances)>0:
-           i=np.argmin(distances)
-           nearest_target = target_positions[i]
-           if self.target_is_free(nearest_target, distances[i], target_positions_arr):
-               return nearest_target
-           distances.pop(i)
-           target_positions.pop(i)
-        return None
+        return self.knowledge.board.assignment(self.color, self.model.steps).exploratory_target_for(self, (x_min, x_end))
     
     def go_to(self, target):
         """Move towards the target."""
@@ -118,6 +263,39 @@ class Robot(Agent):
             return 'MOVE UP'
         
     
+    def asleep(self):
+        """Whether the robot chose to do nothing and the knowledge it decided on did not change since:
+        it would choose the same, so it does not deliberate again until waste of its color or the
+        availability of a teammate changes (or the teammates move and cells are explored, when it
+        had somewhere to go)."""
+        return self.parked is not None \
+            and self.parked == self.knowledge.board.revision(self.color, self.parked[2] is not None)
+
+    def decide(self):
+        """Deliberate, and park the robot when it chooses to do nothing. Only robots sharing the board
+        are parked: every change of the grid is then published by the robot that made it."""
+        board = self.knowledge.board
+        code = COLOR_CODE[self.color]
+        revision = board.revision(self.color)
+        action = self.deliberate()
+        self.parked = None
+        if action != 'NONE' or self.strategy < 2 or self.terminated:
+            return action
+        if len(board.known_targets[code]) == 0 and board.unknown.nearest(self.knowledge.position, self.knowledge.my_zone[:2]) is None:
+            # nothing to pick up or explore, where the teammates are does not matter
+            self.parked = board.revision(self.color, full=False)
+        elif self.strategy < 3 or board.assignments[code].revision == revision:
+            # with strategy 3, the assignment of the tick may predate what the robots before it did
+            self.parked = revision
+        return action
+
+    def sleep(self):
+        """Step of a parked robot: it does nothing. With strategy 3, the assignment of the team is
+        still computed at its turn, as its deliberation would have."""
+        if self.strategy == 3:
+            self.knowledge.board.assignment(self.color, self.model.steps).claims(self.knowledge.my_zone[:2])
+        self.model.rest(self)
+
     def deliberate(self):
         """Decide the next action. Corresponds to the “reasoning” step of the agent. It takes as input the “knowledge” """
         if self.strategy<3:
@@ -136,22 +314,17 @@ class Robot(Agent):
            # go right to drop it off
            return 'MOVE RIGHT'
        
-       x,y = self.knowledge.position
-       color_code = COLOR_CODE[self.color]
-       targets = self.knowledge.target_positions[:,:,color_code]
+       board = self.knowledge.board
+       known_targets = board.known_targets[COLOR_CODE[self.color]]
 
-       if targets[x,y]>0:
+       if self.knowledge.position in known_targets:
           return 'PICKUP'
        
-       target_positions = np.argwhere(targets > 0)
-       unknown=np.argwhere(targets < 0)
-       
-       if target_positions.size>0:
-            distances = np.abs(target_positions[:, 0] - x) + np.abs(target_positions[:, 1] - y)
-            nearest_target = target_positions[np.argmin(distances)]
+       nearest_target = known_targets.nearest(self.knowledge.position)
+       if nearest_target is not None:
             return self.go_to(nearest_target)
        
-       if unknown.size>0 or self.strategy==1:
+       if len(board.unknown)>0 or self.strategy==1:
            return 'MOVE'
        
        return self.gather_remaining_waste()
@@ -176,7 +349,7 @@ class Robot(Agent):
             return self.go_to(assigned_target)
         
         assigned_target=self.get_exploratory_target()
-        if assigned_target is not None and not (assigned_target==self.knowledge.position).all():
+        if assigned_target is not None and assigned_target != self.knowledge.position:
             return self.go_to(assigned_target)
         
         return self.gather_remaining_waste()
@@ -184,13 +357,13 @@ class Robot(Agent):
     def gather_remaining_waste(self):
         """Gather the remaining waste."""
         # the grid is known and empty
-        targets = self.knowledge.target_positions[:,:,COLOR_CODE[self.color]]
-        empty = (targets == 0).all()
+        board = self.knowledge.board
+        empty = len(board.unknown)==0 and len(board.known_targets[COLOR_CODE[self.color]])==0
         if not empty:
             return 'NONE'
     
         carrying_agents = [agent_id for agent_id, position in \
-             self.knowledge.available_agents_pos[self.color].items() \
+             self.knowledge.board.available_agents_pos[self.color].items() \
                  if position is None]
         carrying_agents.sort()
         if self.unique_id not in carrying_agents:
@@ -209,15 +382,16 @@ class Robot(Agent):
     def step_agent(self): 
         if self.terminated:
             return 'NONE'
-        action = self.deliberate()
+        if self.asleep():
+            self.sleep()
+            return 'NONE'
+        action = self.decide()
         percepts = self.model.do(self, action)
+        # With communication the board is shared, publishing once informs every robot
         self.update(percepts)
 
-        # Communication with other agents
-        if self.strategy>1:
-            for agent in self.model.agents:
-                if isinstance(agent, Robot):
-                    agent.update(percepts)
+        if self.terminated:
+            self.model.retire(self)
 
     def get_possible_moves(self):
         possible_moves = []
@@ -283,33 +457,30 @@ class Robot(Agent):
 
 
 class greenAgent(Robot):
-    def __init__(self, model: Model, strategy=3):
+    def __init__(self, model: Model, position, strategy=3):
         width, height = model.width, model.height
-        my_zone = (0, width // 3 - 1, 0, height - 1)
-        allowed_zone = (0, width // 3 - 1, 0, height - 1)
-        position = (random.randint(my_zone[0], my_zone[1]), random.randint(my_zone[2], my_zone[3]))
-        target_positions = -np.ones((width, height, 3), dtype=int)
-        knowledge = Knowledge(position=position, target_positions=target_positions, my_zone=my_zone, allowed_zone=allowed_zone)
+        my_zone = (*model.zone_bounds('green'), 0, height - 1)
+        allowed_zone = (0, model.zone_bounds('green')[1], 0, height - 1)
+        board = model.blackboard if strategy > 1 else Blackboard(width, height)
+        knowledge = Knowledge(position=position, board=board, my_zone=my_zone, allowed_zone=allowed_zone)
         super().__init__(model, knowledge, 'green', strategy)
 
 class yellowAgent(Robot):
-    def __init__(self, model: Model, strategy=3):
+    def __init__(self, model: Model, position, strategy=3):
         width, height = model.width, model.height
-        my_zone = (width // 3, 2 * width // 3 - 1, 0, height - 1)
-        allowed_zone = (0, 2 * width // 3 - 1, 0, height - 1)
-        position = (random.randint(my_zone[0], my_zone[1]), random.randint(my_zone[2], my_zone[3]))
-        target_positions = -np.ones((width, height, 3), dtype=int)
-        knowledge = Knowledge(position=position, target_positions=target_positions, my_zone=my_zone, allowed_zone=allowed_zone)
+        my_zone = (*model.zone_bounds('yellow'), 0, height - 1)
+        allowed_zone = (0, model.zone_bounds('yellow')[1], 0, height - 1)
+        board = model.blackboard if strategy > 1 else Blackboard(width, height)
+        knowledge = Knowledge(position=position, board=board, my_zone=my_zone, allowed_zone=allowed_zone)
         super().__init__(model, knowledge, 'yellow', strategy)
 
 class redAgent(Robot):
-    def __init__(self, model: Model, strategy=3):
+    def __init__(self, model: Model, position, strategy=3):
         width, height = model.width, model.height
-        my_zone = (2 * width // 3, width - 1, 0, height - 1)
-        allowed_zone = (0, width - 1, 0, height - 1)
-        position = (random.randint(my_zone[0], my_zone[1]), random.randint(my_zone[2], my_zone[3]))
-        target_positions = -np.ones((width, height, 3), dtype=int)
-        knowledge = Knowledge(position=position, target_positions=target_positions, my_zone=my_zone, allowed_zone=allowed_zone)
+        my_zone = (*model.zone_bounds('red'), 0, height - 1)
+        allowed_zone = (0, model.zone_bounds('red')[1], 0, height - 1)
+        board = model.blackboard if strategy > 1 else Blackboard(width, height)
+        knowledge = Knowledge(position=position, board=board, my_zone=my_zone, allowed_zone=allowed_zone)
         super().__init__(model, knowledge, 'red', strategy)
 
     def deliberate_v2(self):
@@ -322,19 +493,16 @@ class redAgent(Robot):
                return 'PUTDOWN'
            return self.go_to(waste_disposal)
        
-       color_code = COLOR_CODE[self.color]
-       targets = self.knowledge.target_positions[:,:,color_code]
+       known_targets = self.knowledge.board.known_targets[COLOR_CODE[self.color]]
 
-       if targets[x,y]>0:
+       if self.knowledge.position in known_targets:
           return 'PICKUP'
        
-       target_positions = np.argwhere(targets > 0)
+       nearest_target = known_targets.nearest(self.knowledge.position)
 
-       if target_positions.size == 0:
+       if nearest_target is None:
            return 'MOVE'
        
-       distances = np.abs(target_positions[:, 0] - x) + np.abs(target_positions[:, 1] - y)
-       nearest_target = target_positions[np.argmin(distances)]
        target_x, target_y = nearest_target
        
        if target_x < x:
@@ -365,7 +533,7 @@ class redAgent(Robot):
             return self.go_to(assigned_target)
 
         assigned_target=self.get_exploratory_target()
-        if assigned_target is not None and not (assigned_target==self.knowledge.position).all():
+        if assigned_target is not None and assigned_target != self.knowledge.position:
             return self.go_to(assigned_target)
 
         return "NONE"
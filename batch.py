@@ -0,0 +1,92 @@
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from model import RobotMission
+
+PARAMETERS = ["n_g", "n_y", "n_r", "n_waste", "width", "height", "strategy"]
+
+
+def run_mission(params):
+    """Run one headless simulation and return one row of results."""
+    params = dict(params)
+    seed = params.pop("seed")
+    max_steps = params.pop("max_steps")
+    start = time.perf_counter()
+    # only the final values are kept, the reporters are sampled at the start and the end of the run
+    model = RobotMission(seed=seed, collector="columnar", collect_every=max_steps + 1, **params)
+    steps, reason = model.run_until_done(max_steps)
+    model.close()
+
+    row = {**params, "seed": seed, "steps": steps, "completed": reason is not None, "reason": reason}
+    for name, reporter in model.datacollector.model_reporters.items():
+        row[name] = reporter(model)
+    row["runtime_s"] = time.perf_counter() - start
+    return row
+
+
+def parameter_grid(parameters, seeds, max_steps):
+    """Cartesian product of the parameter values, one entry per run.
+    A "size" parameter holds (width, height) pairs."""
+    names = list(parameters)
+    for values in itertools.product(*(parameters[name] for name in names)):
+        run = dict(zip(names, values))
+        if "size" in run:
+            run["width"], run["height"] = run.pop("size")
+        for seed in seeds:
+            yield {**run, "seed": seed, "max_steps": max_steps}
+
+
+def run_batch(parameters, seeds=range(3), max_steps=2000, processes=None):
+    """Run RobotMission over a parameter grid on a process pool, returns a tidy DataFrame (one row per run)."""
+    runs = list(parameter_grid(parameters, seeds, max_steps))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        rows = list(pool.map(run_mission, runs, chunksize=max(1, len(runs) // (4 * (processes or 8)))))
+    results = pd.DataFrame(rows)
+    return results[[c for c in PARAMETERS if c in results] + [c for c in results if c not in PARAMETERS]]
+
+
+def parse_size(value):
+    """'12' is a 12x12 grid, '30x12' is a 30 wide and 12 high grid."""
+    width, _, height = value.partition("x")
+    return int(width), int(height or width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run RobotMission headless over a parameter grid.")
+    parser.add_argument("--n-g", type=int, nargs="+", default=[1], help="number of green robots")
+    parser.add_argument("--n-y", type=int, nargs="+", default=[1], help="number of yellow robots")
+    parser.add_argument("--n-r", type=int, nargs="+", default=[1], help="number of red robots")
+    parser.add_argument("--n-waste", type=int, nargs="+", default=[12], help="number of waste")
+    parser.add_argument("--size", type=parse_size, nargs="+", default=[(12, 12)], help="grid sizes, e.g. 12 30x12")
+    parser.add_argument("--strategy", type=int, nargs="+", default=[1, 2, 3], choices=[1, 2, 3])
+    parser.add_argument("--seeds", type=int, default=3, help="number of seeded runs per configuration")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--max-steps", type=int, default=2000, help="step budget of each run")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--out", default="results.csv", help="output table, .csv or .parquet")
+    args = parser.parse_args()
+
+    parameters = {
+        "n_g": args.n_g,
+        "n_y": args.n_y,
+        "n_r": args.n_r,
+        "n_waste": args.n_waste,
+        "size": args.size,
+        "strategy": args.strategy,
+    }
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    results = run_batch(parameters, seeds, args.max_steps, args.processes)
+
+    if args.out.endswith(".parquet"):
+        results.to_parquet(args.out, index=False)
+    else:
+        results.to_csv(args.out, index=False)
+    print(f"{len(results)} runs written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import mesa
+import numpy as np
+
+from model import RobotMission
+
+
+def timed(function, totals, name):
+    """Wrap a callable so that its wall time is accumulated in totals[name]."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        totals[name] += time.perf_counter() - start
+        return result
+    return wrapper
+
+
+def benchmark_run(config):
+    """Build and run one configuration, return its measures. Runs in a fresh process so that
+    the peak RSS belongs to this configuration only."""
+    start = time.perf_counter()
+    model = RobotMission(config["n_robots"], config["n_robots"], config["n_robots"], config["n_waste"],
+                         width=config["size"], height=config["size"], seed=config["seed"],
+                         strategy=config["strategy"])
+    construction = time.perf_counter() - start
+
+    totals = {"step": 0.0, "step_agent": 0.0, "collect": 0.0}
+    for robot in model.robots:
+        robot.step_agent = timed(robot.step_agent, totals, "step_agent")
+    model.datacollector.collect = timed(model.datacollector.collect, totals, "collect")
+    step = timed(model.step, totals, "step")
+    while model.running and model.steps < config["max_steps"]:
+        step()
+    completed = not model.running
+    model.close()
+
+    steps = max(model.steps, 1)
+    return {
+        **config,
+        "construction_s": construction,
+        "steps": model.steps,
+        "completed": completed,
+        "completion_s": totals["step"] if completed else None,
+        "steps_per_s": steps / totals["step"] if totals["step"] else None,
+        "step_agent_s_per_step": totals["step_agent"] / steps,
+        "collect_s_per_step": totals["collect"] / steps,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def summarize(runs):
+    """Median of the repeated runs of one configuration."""
+    summary = dict(runs[0])
+    for key in ("construction_s", "completion_s", "steps_per_s", "step_agent_s_per_step",
+                "collect_s_per_step", "peak_rss_mb"):
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = statistics.median(values) if values else None
+    summary["completed"] = all(run["completed"] for run in runs)
+    return summary
+
+
+def environment():
+    """Metadata identifying where and on which commit the benchmark ran."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "mesa": mesa.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def run_benchmarks(sizes, robots, wastes, strategies, max_steps=500, repeat=3, seed=0):
+    """Sweep the configurations, one fresh process per run, runs are executed one at a time."""
+    configs = [
+        {"size": size, "n_robots": n_robots, "n_waste": n_waste, "strategy": strategy,
+         "max_steps": max_steps, "seed": seed + i}
+        for size, n_robots, n_waste, strategy in itertools.product(sizes, robots, wastes, strategies)
+        for i in range(repeat)
+    ]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as pool:
+        runs = list(pool.map(benchmark_run, configs))
+    return [summarize(runs[i:i + repeat]) for i in range(0, len(runs), repeat)]
+
+
+def compare(results, reference):
+    """Print the relative change of each measure against a previous benchmark file."""
+    key = lambda r: (r["size"], r["n_robots"], r["n_waste"], r["strategy"])
+    previous = {key(r): r for r in reference["results"]}
+    print(f"compared to {reference['environment']['commit']}:")
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        changes = []
+        for measure in ("construction_s", "steps_per_s", "collect_s_per_step", "peak_rss_mb"):
+            if result[measure] and old[measure]:
+                changes.append(f"{measure} {100 * (result[measure] / old[measure] - 1):+.1f}%")
+        print(f"  size={result['size']} robots={result['n_robots']}x3 waste={result['n_waste']} "
+              f"strategy={result['strategy']}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmark of RobotMission.")
+    parser.add_argument("--size", type=int, nargs="+", default=[30, 60, 120], help="grid sizes (square grids)")
+    parser.add_argument("--robots", type=int, nargs="+", default=[3, 10, 30], help="robots per color")
+    parser.add_argument("--waste", type=int, nargs="+", default=[30, 300], help="number of waste")
+    parser.add_argument("--strategy", type=int, nargs="+", default=[1, 2, 3], choices=[1, 2, 3])
+    parser.add_argument("--max-steps", type=int, default=500, help="step budget of each run")
+    parser.add_argument("--repeat", type=int, default=3, help="seeded runs per configuration (median is kept)")
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--compare", help="previous benchmark file to compare with")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.size, args.robots, args.waste, args.strategy, args.max_steps, args.repeat)
+    with open(args.out, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"{len(results)} configurations written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import json
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from agents import Robot, COLOR_CODE, CODE_COLOR
+from collector import MetricsCollector
+from objects import Waste
+
+NO_WASTE = -1 # empty slot of the carried waste array
+
+
+@dataclass
+class Checkpoint:
+    """State of a RobotMission between two steps: NumPy arrays (grid, robots, knowledge) and a few
+    JSON-serializable values (parameters, counters, generator states, collected data)."""
+    arrays: dict = field(default_factory=dict)
+    state: dict = field(default_factory=dict)
+
+    def save(self, path):
+        """Write the checkpoint as an uncompressed .npz file."""
+        np.savez(path, **self.arrays, _state=np.frombuffer(json.dumps(self.state).encode(), dtype=np.uint8))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files if name != "_state"}
+            state = json.loads(data["_state"].tobytes().decode())
+        return cls(arrays, state)
+
+
+def _random_state(state):
+    """random.getstate() as JSON-serializable lists."""
+    version, internal, gauss = state
+    return [version, list(internal), gauss]
+
+
+def snapshot(model):
+    """Checkpoint of a model between two steps. Profiling and trajectory recording are not kept."""
+    state = {
+        "params": {
+            "n_g": model.num_green_agents, "n_y": model.num_yellow_agents, "n_r": model.num_red_agents,
+            "n_waste": model.num_waste, "width": model.width, "height": model.height, "seed": model.seed,
+            "strategy": model.strategy, "engine": "agents" if model.engine is None else "array",
+            "waste_storage": "agents" if model.waste_agents else "counts",
+            "stepping": "synchronous" if model.synchronous else "sequential",
+        },
+        "collector": {"kind": "mesa"},
+        "steps": model.steps,
+        "running": model.running,
+        "completion_reason": model.completion_reason,
+        "waste_left": model.waste_left,
+        "waste_disposed": model.waste_disposed,
+        "waste_carried": model.waste_carried,
+        "acting": model.acting,
+        "idle_steps": model.idle_steps,
+        "waste_transformed": model.waste_transformed,
+        "model_vars": {name: np.asarray(values).tolist() for name, values in model.datacollector.model_vars.items()},
+        "schedule_random": _random_state(model.schedule_random.getstate()), # order of the robots in a step
+        "model_random": _random_state(model.random.getstate()),
+        "model_rng": model.rng.bit_generator.state,
+    }
+    if isinstance(model.datacollector, MetricsCollector):
+        # sampled steps are kept, spilled chunks are read back (the restored model keeps them in memory)
+        state["collector"] = {"kind": "columnar", "every": model.datacollector.every}
+        state["collected_steps"] = model.datacollector.column("Step").tolist()
+    arrays = {"waste_counts": model.waste_counts.copy()}
+    if model.engine is not None:
+        engine, state["engine_rngs"] = model.engine.get_state()
+        arrays.update({f"engine_{name}": values for name, values in engine.items()})
+        return Checkpoint(arrays, state)
+
+    # every robot ever created, retired ones included (they stay on the grid)
+    robots = sorted((agent for agent in model.agents if isinstance(agent, Robot)), key=lambda robot: robot.unique_id)
+    scheduled = set(model.robots)
+    carried = np.full((len(robots), 2), NO_WASTE, dtype=np.int8)
+    for i, robot in enumerate(robots):
+        for j, waste in enumerate(robot.waste_carried):
+            carried[i, j] = COLOR_CODE[getattr(waste, "radioactivity_level", waste)]
+    arrays.update({
+        "robot_ids": np.array([robot.unique_id for robot in robots], dtype=np.int64),
+        "robot_positions": np.array([robot.knowledge.position for robot in robots], dtype=np.int64).reshape(-1, 2),
+        "robot_reset_zone": np.array([robot.knowledge.reset_zone for robot in robots], dtype=bool),
+        "robot_available": np.array([robot.available for robot in robots], dtype=bool),
+        "robot_terminated": np.array([robot.terminated for robot in robots], dtype=bool),
+        "robot_scheduled": np.array([robot in scheduled for robot in robots], dtype=bool),
+        "robot_carried": carried,
+        "robot_counters": np.array([[robot.time_not_working, robot.distance_traveled, robot.waste_handled]
+                                    for robot in robots], dtype=np.int64).reshape(-1, 3),
+    })
+    # the shared board, or the private board of each robot without communication
+    boards = [model.blackboard] if model.blackboard is not None else [robot.knowledge.board for robot in robots]
+    # allocated tiles of the knowledge maps, with the board they belong to
+    tiles = [board.target_map.get_tiles() for board in boards]
+    arrays["board_tile_keys"] = np.array([(i, tx, ty) for i, (keys, _) in enumerate(tiles) for tx, ty in keys.tolist()],
+                                         dtype=np.int64).reshape(-1, 3)
+    arrays["board_tiles"] = np.concatenate([contents for _, contents in tiles]) if tiles else \
+        np.zeros((0, 1, 1, 3), dtype=np.int8)
+    state["boards"] = [{
+        "version": board.version,
+        "available_agents_pos": {color: [[agent_id, position] for agent_id, position in positions.items()]
+                                 for color, positions in board.available_agents_pos.items()},
+    } for board in boards]
+    return Checkpoint(arrays, state)
+
+
+def restore(checkpoint, strategy=None):
+    """New model continuing exactly from the checkpoint. With another strategy, the run is forked:
+    strategies 2 and 3 share the same knowledge and can be swapped, strategy 1 cannot."""
+    from model import RobotMission
+
+    arrays, state = checkpoint.arrays, checkpoint.state
+    params = dict(state["params"])
+    if strategy is not None and strategy != params["strategy"]:
+        if min(strategy, params["strategy"]) < 2:
+            raise ValueError("Only strategies 2 and 3 can be swapped, they share the same knowledge.")
+        params["strategy"] = strategy
+    n_waste = params.pop("n_waste")
+    collector = state.get("collector", {"kind": "mesa"})
+    model = RobotMission(**dict(params, n_waste=0), collector=collector["kind"], collect_every=collector.get("every", 1))
+    model.num_waste = n_waste
+
+    if model.engine is not None:
+        engine = {name[len("engine_"):]: values for name, values in arrays.items() if name.startswith("engine_")}
+        model.engine.set_state(engine, state["engine_rngs"])
+        model.sync_engine()
+    else:
+        _restore_agents(model, arrays, state)
+
+    model.waste_counts[...] = arrays["waste_counts"]
+    model.waste_left = dict(state["waste_left"])
+    model.waste_disposed = state["waste_disposed"]
+    model.waste_carried = dict(state["waste_carried"])
+    model.acting = state["acting"]
+    model.idle_steps = state["idle_steps"]
+    model.waste_transformed = dict(state["waste_transformed"])
+    model.completion_reason = state["completion_reason"]
+    model.running = state["running"]
+    model.steps = state["steps"]
+    if collector["kind"] == "columnar":
+        model.datacollector.load(state["collected_steps"], state["model_vars"])
+    else:
+        model.datacollector.model_vars = {name: list(values) for name, values in state["model_vars"].items()}
+    version, internal, gauss = state["schedule_random"]
+    model.schedule_random.setstate((version, tuple(internal), gauss))
+    version, internal, gauss = state["model_random"]
+    model.random.setstate((version, tuple(internal), gauss))
+    model.rng.bit_generator.state = state["model_rng"]
+    return model
+
+
+def _restore_agents(model, arrays, state):
+    """Put the robots, their knowledge and the waste of the checkpoint in a model built without waste."""
+    robots = sorted(model.robots, key=lambda robot: robot.unique_id)
+    if [robot.unique_id for robot in robots] != arrays["robot_ids"].tolist():
+        raise ValueError("The checkpoint robots do not match the model robots.")
+    for i, robot in enumerate(robots):
+        position = tuple(arrays["robot_positions"][i].tolist())
+        model.grid.move_agent(robot, position)
+        robot.knowledge.position = position
+        robot.knowledge.reset_zone = bool(arrays["robot_reset_zone"][i])
+        robot.available = bool(arrays["robot_available"][i])
+        robot.terminated = bool(arrays["robot_terminated"][i])
+        robot.time_not_working, robot.distance_traveled, robot.waste_handled = arrays["robot_counters"][i].tolist()
+        robot.waste_carried = []
+        for code in arrays["robot_carried"][i].tolist():
+            if code == NO_WASTE:
+                continue
+            if model.waste_agents:
+                waste = Waste(model, CODE_COLOR[code], position=position)
+                waste.active = False
+                model.grid.place_agent(waste, position)
+            else:
+                waste = CODE_COLOR[code]
+            robot.waste_carried.append(waste)
+        if not arrays["robot_scheduled"][i]:
+            model.robots.discard(robot)
+    counters = arrays["robot_counters"]
+    model.time_not_working, model.distance_traveled, model.waste_handled = counters.sum(axis=0).tolist()
+    model.waste_handled_squares = int((counters[:, 2] ** 2).sum())
+
+    boards = [model.blackboard] if model.blackboard is not None else [robot.knowledge.board for robot in robots]
+    owner = arrays["board_tile_keys"][:, 0]
+    maps = [(arrays["board_tile_keys"][owner == i, 1:], arrays["board_tiles"][owner == i]) for i in range(len(boards))]
+    for board, (keys, tiles), saved in zip(boards, maps, state["boards"]):
+        board.load(keys, tiles)
+        board.version = saved["version"]
+        board.available_agents_pos = {
+            color: {agent_id: tuple(position) if position is not None else None for agent_id, position in entries}
+            for color, entries in saved["available_agents_pos"].items()
+        }
+
+    if model.waste_agents:
+        for x, y, code in zip(*np.nonzero(arrays["waste_counts"])):
+            for _ in range(arrays["waste_counts"][x, y, code]):
+                model.grid.place_agent(Waste(model, CODE_COLOR[int(code)], position=(int(x), int(y))), (int(x), int(y)))
+
+
+def fork(model, strategy=None):
+    """Copy of a running model, optionally continuing with another strategy."""
+    return restore(snapshot(model), strategy)
@@ -0,0 +1,181 @@
+import itertools
+import operator
+import os
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class ChunkWriter:
+    """Background thread writing full chunks of rows to disk, one .npy file per column and chunk:
+    <path>/<column>/<chunk>.npy, so that a column can be read back as memory maps."""
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            chunk, rows = item
+            for name in rows.dtype.names:
+                os.makedirs(os.path.join(self.path, name), exist_ok=True)
+                np.save(os.path.join(self.path, name, f"{chunk:06d}.npy"), rows[name])
+            self.queue.task_done()
+
+    def write(self, chunk, rows):
+        self.queue.put((chunk, rows))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class ChunkedColumn:
+    """Values of a column split in chunks (memory maps of the spilled chunks, then a view of the
+    buffer), read without concatenating them: an item or a slice only reads the chunks it covers,
+    np.asarray concatenates all of them."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.ends = np.cumsum([len(chunk) for chunk in chunks])
+
+    def __len__(self):
+        return int(self.ends[-1])
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.chunks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start >= stop or step < 0:
+                return np.asarray(self)[index]
+            first = np.searchsorted(self.ends, start, side="right")
+            last = np.searchsorted(self.ends, stop - 1, side="right")
+            offset = self.ends[first] - len(self.chunks[first])
+            return np.concatenate(self.chunks[first:last + 1])[start - offset:stop - offset:step]
+        index = operator.index(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("index out of range")
+        chunk = np.searchsorted(self.ends, index, side="right")
+        return self.chunks[chunk][index - self.ends[chunk] + len(self.chunks[chunk])]
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.concatenate(self.chunks)
+        return values if dtype is None else values.astype(dtype)
+
+    def tolist(self):
+        return np.asarray(self).tolist()
+
+
+class MetricsCollector:
+    """Drop-in replacement of mesa.DataCollector for model reporters, storing the values in a
+    preallocated NumPy buffer (one structured record per collected step, one field per reporter)
+    instead of Python lists. A row is collected every `every` steps (and when the mission ends).
+    With `spill`, full chunks of chunk_size rows are written to that directory by a background
+    thread and dropped from memory; otherwise the buffer grows by doubling.
+    Reporters returning integers (or booleans) get int64 fields, the others float64 (None is NaN)."""
+    def __init__(self, model_reporters, every=1, chunk_size=4096, spill=None):
+        self.model_reporters = dict(model_reporters)
+        self.reporters = list(self.model_reporters.values())
+        self.every = every
+        self.chunk_size = chunk_size
+        self.spill = spill
+        self.writer = None # started at the first spilled chunk, stopped by close
+        self.spilled = 0 # chunks written to disk
+        self.maps = {} # reporter -> memory maps of the spilled chunks read so far
+        self.size = 0 # rows in memory
+        self.rows = None # allocated at the first row, once the types of the reporters are known
+
+    def collect(self, model):
+        """Collect the reporters if the step is sampled."""
+        if model.steps % self.every and model.running:
+            return
+        row = (model.steps, *[reporter(model) for reporter in self.reporters])
+        if self.rows is None:
+            self.rows = np.empty(self.chunk_size, dtype=[("Step", np.int64)] + [
+                (name, np.int64 if isinstance(value, (bool, int, np.integer)) else np.float64)
+                for name, value in zip(self.model_reporters, row[1:])
+            ])
+        elif self.size == len(self.rows):
+            self._make_room()
+        self.rows[self.size] = row
+        self.size += 1
+
+    def _make_room(self):
+        """The buffer is full: spill it, or double it when the data stays in memory."""
+        if self.spill is None:
+            self.rows = np.concatenate((self.rows, np.empty_like(self.rows)))
+            return
+        # the writer owns the full buffer, a new one is allocated
+        self._write(self.rows)
+        self.rows = np.empty_like(self.rows)
+        self.size = 0
+
+    def _write(self, rows):
+        """Spill rows as the next chunk."""
+        if self.writer is None:
+            self.writer = ChunkWriter(self.spill)
+        self.writer.write(self.spilled, rows)
+        self.spilled += 1
+
+    def _spilled(self, name):
+        """Memory maps of the chunks of a column written to disk, each chunk is mapped once."""
+        maps = self.maps.setdefault(name, [])
+        if len(maps) < self.spilled:
+            # waits for the writer only when chunks were spilled since the last read
+            if self.writer is not None:
+                self.writer.queue.join()
+            maps.extend(np.load(os.path.join(self.spill, name, f"{chunk:06d}.npy"), mmap_mode="r")
+                        for chunk in range(len(maps), self.spilled))
+        return maps
+
+    def column(self, name):
+        """Values of a reporter ("Step" for the collected steps). A view of the buffer when nothing
+        was spilled, else a ChunkedColumn of the memory-mapped chunks followed by the buffer."""
+        if self.rows is None:
+            return np.zeros(0, dtype=np.int64)
+        values = self.rows[name][:self.size]
+        if self.spilled == 0:
+            return values
+        return ChunkedColumn(self._spilled(name) + [values])
+
+    @property
+    def model_vars(self):
+        """Collected values per reporter, like mesa.DataCollector.model_vars."""
+        return {name: self.column(name) for name in self.model_reporters}
+
+    def get_model_vars_dataframe(self):
+        """DataFrame of the collected values, indexed by step."""
+        return pd.DataFrame({name: np.asarray(values) for name, values in self.model_vars.items()},
+                            index=pd.Index(np.asarray(self.column("Step")), name="Step"))
+
+    def load(self, steps, model_vars):
+        """Replace the collected values (e.g. restored from a checkpoint)."""
+        values = {name: np.asarray(model_vars[name]) for name in self.model_reporters}
+        self.rows = np.empty(max(self.chunk_size, len(steps)), dtype=[("Step", np.int64)] + [
+            (name, np.int64 if column.dtype.kind in "biu" else np.float64) for name, column in values.items()
+        ])
+        self.rows["Step"][:len(steps)] = steps
+        for name, column in values.items():
+            self.rows[name][:len(steps)] = column
+        self.size = len(steps)
+
+    def close(self):
+        """Write the remaining rows when spilling, and stop the writer. Collecting again restarts it."""
+        if self.spill is None:
+            return
+        if self.size:
+            self._write(self.rows[:self.size].copy())
+            self.size = 0
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,583 @@
+import numpy as np
+
+from agents import COLOR_CODE, zone_bounds
+
+# actions of the array engine
+NONE, PICKUP, TRANSFORM, PUTDOWN, STEP, EXPLORE = range(6)
+FAR = 1 << 29 # row of an empty column, far beyond any distance on the grid
+MAX_PAIRS = 1 << 16 # robots x claims of their team compared at once by free_cells
+NEIGHBORHOOD = np.array([(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)]) # von Neumann, center included
+# state of a mission, see ArrayEngine.outcome
+RUNNING, DISPOSED, RETIRED, STRANDED, IDLE = range(5)
+OUTCOMES = (None, "disposed", "retired", "stranded", "idle")
+IDLE_STEPS = 2 # a tick without action can still update the knowledge, the next one changes nothing
+
+
+def random_streams(seed):
+    """Independent generators derived from a seed: one for the initial layout, one for the order in
+    which the robots act (shuffle of the agents, contested pickups of the array engine)."""
+    layout, schedule = np.random.SeedSequence(seed).spawn(2)
+    return np.random.default_rng(layout), np.random.default_rng(schedule)
+
+
+def draw_layout(rng, width, height, n_robots, n_waste):
+    """Initial positions of the robots (green, yellow then red) and of the waste, drawn at once in the
+    zones of their colors. Return the robot x, y and the waste x, y, color codes."""
+    bounds = np.array([zone_bounds(width, color) for color in COLOR_CODE])
+    colors = np.repeat(np.arange(3), n_robots)
+    robot_x = rng.integers(bounds[colors, 0], bounds[colors, 1] + 1)
+    robot_y = rng.integers(0, height, len(colors))
+    codes = np.repeat(np.arange(3), [n_waste // 3, 2 * n_waste // 3 - n_waste // 3, n_waste - 2 * n_waste // 3])
+    waste_x = rng.integers(bounds[codes, 0], bounds[codes, 1] + 1)
+    waste_y = rng.integers(0, height, len(codes))
+    return robot_x, robot_y, waste_x, waste_y, codes
+
+
+def distinct(values):
+    """Sorted distinct values, as np.unique which is several times slower on the arrays of a tick."""
+    values = np.sort(values)
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = values[1:] != values[:-1]
+    return values[first]
+
+
+def red_to_come(waste):
+    """Red waste that the waste (..., 3) left per color, on the grid or carried, can still give."""
+    waste = np.asarray(waste)
+    return waste[..., 2] + (waste[..., 1] + waste[..., 0] // 2) // 2
+
+
+class ColumnTables:
+    """Nearest-row tables of windows of boolean maps mask (K, W, H): the window m covers the columns
+    start[m] to end[m] of the map source[m], they are padded to the widest window. rows[0, m, y, j]
+    is the closest row y' <= y of the column start[m] + j where mask is set (-FAR when there is none
+    or the column is past the window), rows[1, m, y, j] the closest y' >= y (FAR when there is none).
+    The columns are the last axis, so that the rows of every column at a given y are read at once.
+    The columns whose cells changed are marked, and recomputed by flush before the tables are read."""
+    def __init__(self, mask, source, start, end):
+        self.mask = mask
+        self.source, self.start, self.end = source, start, end
+        self.width = int((end - start).max()) + 1
+        self.rows = np.empty((2, len(source), mask.shape[2], self.width), dtype=np.int32)
+        self.rows[0], self.rows[1] = -FAR, FAR
+        self.stale = np.zeros((len(source), self.width), dtype=bool)
+        m, j = np.divmod(np.arange(len(source) * self.width), self.width)
+        inside = j <= end[m] - start[m]
+        self.refresh(m[inside], j[inside])
+
+    def mark(self, m, j):
+        """Columns j of the windows m where some cells changed."""
+        self.stale[m, j] = True
+
+    def flush(self):
+        """Recomputes the columns marked since the last flush."""
+        m, j = np.nonzero(self.stale)
+        if len(m):
+            self.stale[m, j] = False
+            self.refresh(m, j)
+
+    def refresh(self, m, j):
+        """Recomputes the columns j of the windows m, given once each."""
+        columns = self.mask[self.source[m], self.start[m] + j]
+        rows = np.arange(columns.shape[1], dtype=np.int32)
+        # the rows of the set cells, -FAR or FAR elsewhere (products are faster than np.where on the masks)
+        self.rows[0, m, :, j] = np.maximum.accumulate(columns * (rows + FAR) - FAR, axis=1)
+        self.rows[1, m, :, j] = np.minimum.accumulate((columns * (rows - FAR) + FAR)[:, ::-1], axis=1)[:, ::-1]
+
+    def any(self):
+        """Whether each window has a cell set."""
+        return (self.rows[1, :, 0] < FAR).any(axis=1)
+
+
+def skip_excluded(rows, tables, k, excluded):
+    """Moves the closest rows (below and above, queries x columns) found in tables over the excluded
+    cells, sorted keys (query * columns + x) * H + y, to the next row of the set. Return the entries
+    query * columns + x that moved."""
+    n_windows, height, n_columns = tables.shape[1:]
+    rows, tables = rows.reshape(-1), tables.reshape(-1)
+    half, n = len(rows) // 2, len(excluded)
+    # the excluded cells that are closest rows, by their entry (side, query, x) in rows
+    at, y = np.divmod(np.concatenate((excluded, excluded + half * height)), height)
+    hit = np.flatnonzero(rows[at] == y)
+    at, y = at[hit], y[hit]
+    upward = hit >= n
+    direction = np.where(upward, 1, -1)
+    i = hit - n * upward # in excluded
+    entry = at - half * upward
+    q, x = np.divmod(entry, n_columns)
+    column = (k[q] + n_windows * upward) * height * n_columns + x # in tables, the rows y * columns further
+    key = excluded[i] - y # of the column
+    # the indices past either end of excluded give -1, which no key equals
+    excluded = np.append(excluded, -1)
+    y, direction, at, column, key, i = moving = np.array((y, direction, at, column, key, i))
+    while moving.shape[1]:
+        # the next row of the set is excluded when it is the next excluded key, as the keys are sorted
+        y += direction
+        inside = (y >= 0) & (y < height)
+        y[:] = np.where(inside, np.take(tables, column + y * n_columns, mode="clip"), direction * FAR)
+        rows[at] = y
+        i += direction
+        y, direction, at, column, key, i = moving = moving[:, inside & (excluded[i] == key + y)]
+    return entry
+
+
+def column_rows(tables, k, px, py):
+    """Closest rows below and above py (2, queries, columns) in the columns of the maps k of the
+    column tables, and the Manhattan distance (queries, columns) from (px, py) to the nearest of
+    them. px is relative to the first column of the tables."""
+    height, n_columns = tables.shape[2:]
+    rows = np.take(tables.reshape(2, -1, n_columns), k * height + py, axis=1)
+    below, above = rows
+    # distances on int32 like the tables
+    row = py.astype(np.int32)[:, None]
+    distance = np.minimum(row - below, above - row)
+    distance += np.abs(np.arange(n_columns, dtype=np.int32) - px.astype(np.int32)[:, None])
+    return rows, distance
+
+
+def closest_cells(rows, distance, py):
+    """Nearest cell of each query from its column_rows, ties broken on the smallest x then the
+    smallest y. Returns the x, y of the cells and their distance (FAR // 2 or more when none)."""
+    j = np.argmin(distance, axis=1)
+    i = np.arange(len(j))
+    # the row is only resolved for the nearest column
+    below, above = rows[0, i, j], rows[1, i, j]
+    cy = np.where(py - below <= above - py, below, above).astype(np.int64)
+    return j, cy, distance[i, j]
+
+
+def nearest_cells(tables, k, px, py):
+    """Nearest cell (Manhattan distance) of the maps k of the column tables to the positions
+    (px, py), for each query. Ties are broken on the smallest x then the smallest y, like
+    spatial.ColumnIndex. px is relative to the first column of the tables.
+    Returns the x, y of the cells and whether one was found."""
+    if len(k) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=bool)
+    tx, ty, distance = closest_cells(*column_rows(tables, k, px, py), py)
+    return tx, ty, distance < FAR // 2
+
+
+def free_cells(tables, k, px, py, ids, decide):
+    """Nearest cell of the column tables that is free for each robot of a team, as TeamAssignment
+    does it: a cell is not free when a teammate heads to it (it is its nearest cell) and is closer,
+    or as close with a greater id. Only the robots flagged in decide get their free cell,
+    the others only claim theirs."""
+    rows, column_distance = column_rows(tables, k, px, py)
+    tx, ty, distance = closest_cells(rows, column_distance, py)
+    found = distance < FAR // 2
+
+    # strongest claim on each cell: closest teammate first, then greatest id
+    n_windows, height, n_columns = tables.shape[1:]
+    n_ids = int(ids.max(initial=0)) + 1
+    strength = distance.astype(np.int64) * n_ids - ids # the lower the stronger
+    cell = (k * n_columns + tx) * height + ty
+    claimers = np.flatnonzero(found)
+    claimers = claimers[np.lexsort((strength[claimers], cell[claimers]))]
+    first = np.ones(len(claimers), dtype=bool)
+    first[1:] = cell[claimers[1:]] != cell[claimers[:-1]]
+    winners = claimers[first] # sorted by window, then cell
+    won = np.zeros(len(k), dtype=bool)
+    won[winners] = True
+
+    # a robot whose nearest cell is won by a teammate looks for the nearest cell not won against it,
+    # the claims of its team are compared to it at once (by chunks of losers on large teams)
+    losers = np.flatnonzero(decide & found & ~won)
+    if len(losers) == 0:
+        return tx, ty, found
+    claims = np.bincount(k[winners], minlength=n_windows)
+    team_start = np.cumsum(claims) - claims
+    pairs = np.cumsum(claims[k[losers]])
+    chunks = [losers] if pairs[-1] <= MAX_PAIRS else np.split(losers, np.flatnonzero(np.diff(pairs // MAX_PAIRS)) + 1)
+    for losers in chunks:
+        count = claims[k[losers]]
+        offset = np.cumsum(count) - count
+        pair_loser = np.repeat(np.arange(len(losers)), count)
+        claim = winners[np.arange(offset[-1] + count[-1]) + np.repeat(team_start[k[losers]] - offset, count)]
+        loser = losers[pair_loser]
+        loser_distance = np.abs(tx[claim] - px[loser]) + np.abs(ty[claim] - py[loser])
+        blocked = strength[claim] < loser_distance * n_ids - ids[loser]
+        # keys of the cells for each loser, sorted: by loser, then by cell like the claims
+        shift = (np.arange(len(losers)) - k[losers]) * (n_columns * height)
+        excluded = (cell[claim] + shift[pair_loser])[blocked]
+        # only the columns where a closest row is excluded change
+        loser_rows, loser_columns = np.take(rows, losers, axis=1), column_distance[losers]
+        entry = skip_excluded(loser_rows, tables, k[losers], excluded)
+        below, above = loser_rows.reshape(2, -1)[:, entry]
+        q, x = np.divmod(entry, n_columns)
+        row = py[losers[q]].astype(np.int32)
+        loser_columns.reshape(-1)[entry] = np.minimum(row - below, above - row) + np.abs(x - px[losers[q]]).astype(np.int32)
+        tx[losers], ty[losers], reach = closest_cells(loser_rows, loser_columns, py[losers])
+        found[losers] = reach < FAR // 2
+    return tx, ty, found
+
+
+class ArrayEngine:
+    """Robots and waste of RobotMission stored in NumPy arrays instead of Mesa agents.
+    Every robot of a color deliberates at once with the rules of Robot.deliberate_v2/deliberate_v3,
+    on the knowledge of the start of the tick. Then the actions of all robots are applied (pickups
+    first, robots sharing a cell share its waste) and every robot perceives its neighborhood.
+    The state has one entry per robot and one grid per replica: replicas are independent missions
+    with the same parameters and their own seed."""
+    def __init__(self, width, height, n_robots, n_waste, strategy=2, seeds=(None,)):
+        self.width = width
+        self.height = height
+        self.strategy = strategy
+        self.disposal = (width - 1, height // 2)
+        bounds = np.array([zone_bounds(width, color) for color in COLOR_CODE])
+        self.x_min, self.x_end = bounds[:, 0], bounds[:, 1]
+        # waste of a color lies in its zone or on the column before it, where the previous team puts it down
+        self.waste_columns = np.maximum(self.x_min - 1, 0)
+        streams = [random_streams(seed) for seed in seeds]
+        self.rngs = [schedule.spawn(3) for _, schedule in streams] # contested pickups, per replica and team
+        replicas = len(self.rngs)
+
+        ## robots, ordered by replica then color (green, yellow, red) like the unique_id of the agents
+        colors = np.repeat(np.arange(3), n_robots)
+        self.replica = np.repeat(np.arange(replicas), len(colors))
+        self.color = np.tile(colors, replicas)
+        self.ids = np.arange(len(self.color))
+        self.x = np.zeros(len(self.color), dtype=np.int64)
+        self.y = np.zeros(len(self.color), dtype=np.int64)
+        self.load = np.zeros(len(self.color), dtype=np.int8) # waste of their color carried
+        self.product = np.zeros(len(self.color), dtype=bool) # carries the waste they transformed
+        self.available = np.ones(len(self.color), dtype=bool)
+        self.terminated = np.zeros(len(self.color), dtype=bool)
+        self.reset_zone = np.ones(len(self.color), dtype=bool) # exploration heads right
+        self.time_not_working = np.zeros(len(self.color), dtype=np.int64) # efficiency counters, as in RobotMission
+        self.distance_traveled = np.zeros(len(self.color), dtype=np.int64)
+        self.waste_handled = np.zeros(len(self.color), dtype=np.int64)
+
+        ## waste on the ground, per replica, color and cell
+        self.waste = np.zeros((replicas, 3, width, height), dtype=np.int32)
+        for r, (layout, _) in enumerate(streams):
+            # same layout as RobotMission(..., seed) with the agents engine
+            robots = np.flatnonzero(self.replica == r)
+            self.x[robots], self.y[robots], waste_x, waste_y, codes = draw_layout(layout, width, height, n_robots, n_waste)
+            np.add.at(self.waste[r], (codes, waste_x, waste_y), 1)
+        self.left = self.waste.sum(axis=(2, 3), dtype=np.int64) # waste on the ground, per replica and color
+        self.disposed = np.zeros(replicas, dtype=np.int64)
+        self.transformed = np.zeros((replicas, 3), dtype=np.int64) # waste transformed, per replica and color
+        self.running = np.ones(replicas, dtype=bool) # replicas that are still stepped
+        self.idle_steps = np.zeros(replicas, dtype=np.int64) # ticks in a row without any robot acting or retiring
+
+        ## knowledge: one board per replica when robots communicate, else the cells where each robot
+        ## saw waste of its color, as sorted keys robot * W * H + x * H + y
+        if strategy > 1:
+            self.known = np.zeros((replicas, 3, width, height), dtype=bool)
+            self.unknown = np.ones((replicas, width, height), dtype=bool)
+            self.build_tables()
+        else:
+            self.private = np.zeros(0, dtype=np.int64)
+
+    def build_tables(self):
+        """Column tables of the knowledge, one window per replica and team (m = replica * 3 + color):
+        the known waste of its color in the columns where it lies (see waste_columns) and the
+        unknown cells of its zone."""
+        c = np.tile(np.arange(3), len(self.rngs))
+        team = np.arange(len(c))
+        self.known_tables = ColumnTables(self.known.reshape(len(c), self.width, self.height), team,
+                                         self.waste_columns[c], self.x_end[c])
+        self.unknown_tables = ColumnTables(self.unknown, team // 3, self.x_min[c], self.x_end[c])
+        self.unexplored = self.unknown.sum(axis=(1, 2)) # cells not seen yet, per replica
+
+    def step(self):
+        """Advance every running replica by one tick."""
+        robots = np.flatnonzero(~self.terminated & self.running[self.replica])
+        self.count_idle(self.advance(robots))
+        self.perceive(robots)
+
+    def advance(self, robots):
+        """Deliberation and actions of the robots. Return the number of robots that acted or retired,
+        per replica."""
+        action = np.zeros(len(self.color), dtype=np.int8)
+        goal_x = np.zeros(len(self.color), dtype=np.int64) # targets of the robots that step
+        goal_y = np.zeros(len(self.color), dtype=np.int64)
+        self.deliberate(robots, action, goal_x, goal_y)
+        self.time_not_working[robots[action[robots] == NONE]] += 1
+        acted = (action[robots] != NONE) | self.terminated[robots]
+        self.act(action, goal_x, goal_y)
+        return np.bincount(self.replica[robots[acted]], minlength=len(self.rngs))
+
+    def count_idle(self, acted):
+        """Count the ticks in a row without any robot acting or retiring."""
+        idle = self.running & (acted == 0)
+        self.idle_steps = np.where(idle, self.idle_steps + 1, 0)
+
+    def deliberate(self, robots, action, goal_x, goal_y):
+        """Choose the actions of the robots, every color at once."""
+        if len(robots) == 0:
+            return
+        busy = robots[~self.available[robots]]
+        c = self.color[busy]
+        # green and yellow transform then bring the waste to the limit of their zone, red to the disposal zone
+        transform = (c < 2) & (self.load[busy] == 2)
+        action[busy[transform]] = TRANSFORM
+        busy, c = busy[~transform], c[~transform]
+        tx = np.where(c < 2, self.x_end[c], self.disposal[0])
+        ty = np.where(c < 2, self.y[busy], self.disposal[1])
+        arrived = (self.x[busy] == tx) & (self.y[busy] == ty)
+        action[busy[arrived]] = PUTDOWN
+        self.go_to(busy[~arrived], tx[~arrived], ty[~arrived], action, goal_x, goal_y)
+        robots = robots[self.available[robots]]
+        if len(robots) == 0:
+            return
+        if self.strategy < 3:
+            self.deliberate_v2(robots, action, goal_x, goal_y)
+        else:
+            self.deliberate_v3(action, goal_x, goal_y)
+
+    def deliberate_v2(self, robots, action, goal_x, goal_y):
+        """Go to the nearest known waste of their color, explore when none is known."""
+        c, x, y = self.color[robots], self.x[robots], self.y[robots]
+        if self.strategy == 1:
+            tx, ty, found = self.private_nearest(robots)
+        else:
+            m = self.replica[robots] * 3 + c
+            self.known_tables.flush()
+            x_first = self.known_tables.start[m]
+            tx, ty, found = nearest_cells(self.known_tables.rows, m, x - x_first, y)
+            tx += x_first
+        on_target = found & (tx == x) & (ty == y)
+        action[robots[on_target]] = PICKUP
+        going = found & ~on_target
+        self.go_to(robots[going], tx[going], ty[going], action, goal_x, goal_y)
+
+        idle = robots[~found]
+        if self.strategy == 1:
+            action[idle] = EXPLORE
+            return
+        explore = (self.color[idle] == 2) | (self.unexplored[self.replica[idle]] > 0)
+        action[idle[explore]] = EXPLORE
+        # gather_remaining_waste: the grid is known and empty of their waste
+        self.terminated[idle[~explore]] = True
+
+    def deliberate_v3(self, action, goal_x, goal_y):
+        """Go to the nearest known waste of their color that is free, else to the nearest unexplored
+        cell of their zone that is free."""
+        # terminated robots keep their claims, like their entry of available_agents_pos
+        team = np.flatnonzero(self.available & self.running[self.replica])
+        decide = ~self.terminated[team]
+        c, x, y = self.color[team], self.x[team], self.y[team]
+        m = self.replica[team] * 3 + c
+        self.known_tables.flush()
+        x_first = self.known_tables.start[m]
+        tx, ty, found = free_cells(self.known_tables.rows, m, x - x_first, y, team, decide)
+        tx += x_first
+        on_target = decide & found & (tx == x) & (ty == y)
+        action[team[on_target]] = PICKUP
+        going = decide & found & ~on_target
+        self.go_to(team[going], tx[going], ty[going], action, goal_x, goal_y)
+
+        idle = decide & ~found
+        if not idle.any():
+            return
+        self.unknown_tables.flush()
+        x_min = self.unknown_tables.start[m]
+        tx, ty, found = free_cells(self.unknown_tables.rows, m, x - x_min, y, team, idle)
+        tx += x_min
+        going = idle & found & ((tx != x) | (ty != y))
+        self.go_to(team[going], tx[going], ty[going], action, goal_x, goal_y)
+        # gather_remaining_waste: the grid is known and empty of their waste
+        idle = idle & ~going & (c < 2)
+        empty = (self.unexplored[self.replica[team]] == 0) & ~self.known_tables.any()[m]
+        self.terminated[team[idle & empty]] = True
+
+    def private_nearest(self, robots):
+        """Nearest cell where each robot saw waste of its color, from its own knowledge."""
+        area = self.width * self.height
+        start = np.searchsorted(self.private, robots * area)
+        count = np.searchsorted(self.private, (robots + 1) * area) - start
+        tx = np.zeros(len(robots), dtype=np.int64)
+        ty = np.zeros(len(robots), dtype=np.int64)
+        found = count > 0
+        if not found.any():
+            return tx, ty, found
+        start, count, robots = start[found], count[found], robots[found]
+        offset = np.cumsum(count) - count
+        cell = self.private[np.arange(count.sum()) + np.repeat(start - offset, count)] - np.repeat(robots * area, count)
+        distance = np.abs(cell // self.height - np.repeat(self.x[robots], count)) \
+            + np.abs(cell % self.height - np.repeat(self.y[robots], count))
+        best = np.minimum.reduceat(distance * area + cell, offset) % area # smallest distance, x then y
+        tx[found], ty[found] = best // self.height, best % self.height
+        return tx, ty, found
+
+    def go_to(self, robots, tx, ty, action, goal_x, goal_y):
+        """Move towards the targets, the step is taken by act."""
+        action[robots] = STEP
+        goal_x[robots], goal_y[robots] = tx, ty
+
+    def explore_moves(self, robots):
+        """Next cell of the exploration sweep of each robot, as Robot.move."""
+        x, y, c = self.x[robots], self.y[robots], self.color[robots]
+        y_direction = np.where(x % 2 == 1, 1, -1)
+        x_direction = np.where(self.reset_zone[robots], 1, -1)
+        # Robot.get_logical_moves
+        can_left = np.where(c != 0, x >= self.x_min[c], x > self.x_min[c])
+        can_right = x < self.x_end[c]
+        vertical = np.where(y_direction == 1, y < self.height - 1, y > 0)
+        horizontal = np.where(x_direction == 1, can_right, can_left)
+        turn = ~vertical & ~horizontal
+        self.reset_zone[robots[turn]] = ~self.reset_zone[robots[turn]]
+        nx = np.where(vertical, x, np.where(horizontal, x + x_direction, x - x_direction))
+        ny = np.where(vertical, y + y_direction, y)
+        return nx, ny
+
+    def act(self, action, goal_x, goal_y):
+        """Apply the actions of every robot."""
+        replica, color = self.replica, self.color
+        # robots grouped by action, in id order, the phases without robots are skipped
+        grouped = np.argsort(action, kind="stable")
+        end = np.cumsum(np.bincount(action, minlength=EXPLORE + 1)).tolist()
+
+        # pickups, robots in the same cell share its waste
+        robots = grouped[end[NONE]:end[PICKUP]]
+        if len(robots):
+            cell = ((replica[robots] * 3 + color[robots]) * self.width + self.x[robots]) * self.height + self.y[robots]
+            stock = self.waste.reshape(-1)[cell]
+            order = np.argsort(cell, kind="stable")
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = cell[order[1:]] != cell[order[:-1]]
+            if first.all():
+                picked = stock > 0
+            else:
+                starts = np.flatnonzero(first)
+                sizes = np.diff(np.append(starts, len(order)))
+                rank = np.arange(len(order)) - np.repeat(starts, sizes)
+                available = stock[order[starts]]
+                contested = (sizes > available) & (available > 0)
+                for start, size in zip(starts[contested], sizes[contested]):
+                    # not enough waste for everybody, the replica generator draws who gets it
+                    robot = robots[order[start]]
+                    rank[start:start + size] = self.rngs[replica[robot]][color[robot]].permutation(size)
+                picked = np.zeros(len(order), dtype=bool)
+                picked[order] = rank < stock[order]
+            robots = robots[picked]
+            self.move_waste(replica[robots], color[robots], self.x[robots], self.y[robots], -1)
+            self.load[robots] += 1
+            self.waste_handled[robots] += 1
+            self.available[robots] = ~((self.load[robots] == 2) | (color[robots] == 2))
+
+        # transformations, 2 green = 1 yellow and 2 yellow = 1 red
+        robots = grouped[end[PICKUP]:end[TRANSFORM]]
+        if len(robots):
+            self.load[robots] = 0
+            self.product[robots] = True
+            np.add.at(self.transformed, (replica[robots], color[robots]), 2)
+
+        # putdowns, waste put down on the disposal zone is disposed of
+        robots = grouped[end[TRANSFORM]:end[PUTDOWN]]
+        if len(robots):
+            robots = robots[(self.load[robots] > 0) | self.product[robots]]
+            waste_color = color[robots] + self.product[robots]
+            x, y = self.x[robots], self.y[robots]
+            disposed = (x == self.disposal[0]) & (y == self.disposal[1])
+            kept = ~disposed
+            self.move_waste(replica[robots[kept]], waste_color[kept], x[kept], y[kept], 1)
+            np.add.at(self.disposed, replica[robots[disposed]], 1)
+            self.load[robots[~self.product[robots]]] -= 1
+            self.product[robots] = False
+            self.available[robots] = True
+
+        # moves (steps then sweeps), inside the allowed zone of each robot
+        robots = grouped[end[PUTDOWN]:]
+        x, y, tx, ty = self.x[robots], self.y[robots], goal_x[robots], goal_y[robots]
+        # horizontally first, as Robot.go_to
+        horizontal = tx != x
+        nx = np.where(horizontal, x + np.sign(tx - x), x)
+        ny = np.where(horizontal, y, y + np.sign(ty - y))
+        sweeps = end[STEP] - end[PUTDOWN] # first sweep
+        if sweeps < len(robots):
+            nx[sweeps:], ny[sweeps:] = self.explore_moves(robots[sweeps:])
+        valid = (nx >= 0) & (nx <= self.x_end[color[robots]]) & (ny >= 0) & (ny < self.height)
+        robots = robots[valid]
+        self.distance_traveled[robots] += 1
+        self.x[robots] = nx[valid]
+        self.y[robots] = ny[valid]
+
+    def move_waste(self, replica, color, x, y, delta):
+        """Add the waste moved on the grid, delta (+1 or -1) waste of the colors at the cells."""
+        # with the dtypes of the counters, np.add.at does not cast every item
+        np.add.at(self.waste, (replica, color, x, y), np.full(len(x), delta, dtype=self.waste.dtype))
+        np.add.at(self.left, (replica, color), np.full(len(x), delta, dtype=self.left.dtype))
+
+    def perceive(self, robots):
+        """Each robot observes the waste of its cell and of its von Neumann neighbors."""
+        # a neighbor off the grid is clipped back to the cell of the robot
+        x = np.minimum(np.maximum(self.x[robots, None] + NEIGHBORHOOD[:, 0], 0), self.width - 1)
+        y = np.minimum(np.maximum(self.y[robots, None] + NEIGHBORHOOD[:, 1], 0), self.height - 1)
+        replica = self.replica[robots, None]
+        if self.strategy > 1:
+            area = self.width * self.height
+            xy = x * self.height + y
+            cell = (replica * area + xy).ravel() # cells seen, as flat indices of the maps
+            index = (replica * 3 * area + xy).ravel()[:, None] + np.arange(0, 3 * area, area) # cells x colors
+            seen = self.waste.reshape(-1)[index] > 0
+            changed, c = np.nonzero(seen != self.known.reshape(-1)[index])
+            self.known.reshape(-1)[index[changed, c]] = seen[changed, c]
+            # the knowledge outside the window of a team is never read
+            x_changed = x.reshape(-1)[changed]
+            j = x_changed - self.waste_columns[c]
+            inside = (j >= 0) & (x_changed <= self.x_end[c])
+            self.known_tables.mark((cell[changed] // area * 3 + c)[inside], j[inside])
+            # each discovered cell once
+            cell = distinct(cell[self.unknown.reshape(-1)[cell]])
+            self.unknown.reshape(-1)[cell] = False
+            replica, x = np.divmod(cell // self.height, self.width)
+            zone = np.searchsorted(self.x_min, x, side="right") - 1
+            self.unknown_tables.mark(replica * 3 + zone, x - self.x_min[zone])
+            self.unexplored -= np.bincount(replica, minlength=len(self.rngs))
+            return
+        keys = ((robots[:, None] * self.width + x) * self.height + y).ravel()
+        seen = (self.waste[replica, self.color[robots, None], x, y] > 0).ravel()
+        self.private = np.union1d(self.private[~np.isin(self.private, keys)], keys[seen])
+
+    def outcome(self):
+        """Per replica, RUNNING or why the mission is over: DISPOSED when no waste is left (on the grid
+        or carried by a working robot), RETIRED when every robot retired, STRANDED when the waste left
+        cannot give red waste anymore, IDLE when no robot acted for IDLE_STEPS ticks (the replica would
+        not change anymore)."""
+        replicas = len(self.rngs)
+        working = ~self.terminated
+        robots_left = np.bincount(self.replica[working], minlength=replicas)
+        waste = self.left.copy()
+        np.add.at(waste, (self.replica[working], self.color[working]), self.load[working].astype(np.int64))
+        np.add.at(waste, (self.replica[working], self.color[working] + self.product[working]),
+                  self.product[working].astype(np.int64))
+        outcome = np.full(replicas, RUNNING)
+        outcome[self.idle_steps >= IDLE_STEPS] = IDLE
+        outcome[red_to_come(waste) == 0] = STRANDED
+        outcome[robots_left == 0] = RETIRED
+        outcome[waste.sum(axis=1) == 0] = DISPOSED
+        return outcome
+
+    STATE = ("x", "y", "load", "product", "available", "terminated", "reset_zone", "waste", "left", "disposed",
+             "running", "idle_steps", "time_not_working", "distance_traveled", "waste_handled", "transformed")
+
+    def get_state(self):
+        """Copies of the arrays and generator states describing the engine, see set_state."""
+        state = {name: getattr(self, name).copy() for name in self.STATE}
+        if self.strategy > 1:
+            state["known"], state["unknown"] = self.known.copy(), self.unknown.copy()
+        else:
+            state["private"] = self.private.copy()
+        return state, [[rng.bit_generator.state for rng in teams] for teams in self.rngs]
+
+    def set_state(self, state, rng_states):
+        """Restore the state of an engine built with the same parameters."""
+        for name in self.STATE:
+            setattr(self, name, state[name].copy())
+        if self.strategy > 1:
+            # in place, the column tables watch these maps
+            self.known[...] = state["known"]
+            self.unknown[...] = state["unknown"]
+            self.build_tables()
+        else:
+            self.private = state["private"].copy()
+        for teams, team_states in zip(self.rngs, rng_states):
+            for rng, rng_state in zip(teams, team_states):
+                rng.bit_generator.state = rng_state
+
+    def retire(self, replicas):
+        """Stop stepping the given replicas, their state stays as it is."""
+        self.running[replicas] = False
@@ -0,0 +1,58 @@
+import numpy as np
+
+from agents import COLOR_CODE
+from engine import ArrayEngine, OUTCOMES, RUNNING
+
+
+class RobotEnsemble:
+    """Replicas of the same RobotMission configuration, one per seed, stepped together by one
+    ArrayEngine: the state of every replica is stacked along a leading axis. A replica retires
+    (stops being stepped) as soon as its mission is over, its series then keep their last value.
+    Replica i follows the same trajectory as RobotMission(..., seed=seeds[i], engine="array")."""
+    def __init__(self, n_g, n_y, n_r, n_waste, width=10, height=10, seeds=range(10), strategy=2):
+        self.seeds = list(seeds)
+        self.engine = ArrayEngine(width, height, (n_g, n_y, n_r), n_waste, strategy, seeds=self.seeds)
+        self.steps = 0
+        self.completion = np.full(len(self.seeds), -1) # step at which each replica finished, -1 while running
+        self.outcome = np.full(len(self.seeds), RUNNING) # why each replica finished, see engine.OUTCOMES
+        self.disposed = [self.engine.disposed.copy()]
+        self.left = [self.engine.left.copy()]
+        self.retire_finished()
+
+    @property
+    def running(self):
+        """Whether any replica is still stepped."""
+        return bool(self.engine.running.any())
+
+    def retire_finished(self):
+        """Retire the replicas whose mission is over."""
+        outcome = self.engine.outcome()
+        finished = np.flatnonzero(self.engine.running & (outcome != RUNNING))
+        self.completion[finished] = self.steps
+        self.outcome[finished] = outcome[finished]
+        self.engine.retire(finished)
+
+    def step(self):
+        """Advance the running replicas by one tick and record their counters."""
+        self.engine.step()
+        self.steps += 1
+        self.disposed.append(self.engine.disposed.copy())
+        self.left.append(self.engine.left.copy())
+        self.retire_finished()
+
+    def run(self, max_steps=2000):
+        """Step until every replica finished or max_steps ticks were run."""
+        while self.running and self.steps < max_steps:
+            self.step()
+
+    def reasons(self):
+        """Completion reason of each replica, None for the replicas still running."""
+        return [OUTCOMES[outcome] for outcome in self.outcome]
+
+    def series(self):
+        """Per-replica series of the RobotMission reporters, arrays of shape (steps + 1, replicas)."""
+        left = np.stack(self.left)
+        series = {"Total_waste_disposed": np.stack(self.disposed)}
+        for color, code in COLOR_CODE.items():
+            series[f"Left_waste_{color}"] = left[:, :, code]
+        return series
@@ -1,36 +1,45 @@
-from objects import WasteDisposalZone, Waste
+import numpy as np
+
+from agents import CODE_COLOR
 
 
 # Total waste disposed through time
 def compute_disposed_waste(model):
-    agents = model.agents
-    n_waste = len([w for w in agents if isinstance(w, Waste) and w.pos==(model.width-1, model.height//2)])
-   
-    if not hasattr(model, 'previous_n_waste'):
-        model.previous_n_waste = 0
-    
-    total_waste = n_waste + model.previous_n_waste
-    model.previous_n_waste = total_waste
-    
-    return total_waste
-
-# Total waste left in the region through time
+    return model.waste_disposed
+
+# Waste of a color taken out of the region through time: transformed (green, yellow) or disposed of (red)
 def transformed_waste_in_region(model, color):
-    agents = model.agents
-    n_waste = len([w for w in agents if isinstance(w, Waste) and w.radioactivity_level==color and w.pos==None])
-    
-    return n_waste
+    if color == "red":
+        return model.waste_disposed
+    return model.waste_transformed[color]
 
+# Waste lying in the zone of another color: put down at the limit of a zone, waiting for the next team
+def count_waste_handed_over(model):
+    x, y, code = np.nonzero(model.waste_counts)
+    return int(sum(model.waste_counts[i, j, c] for i, j, c in zip(x.tolist(), y.tolist(), code.tolist())
+                   if model.zone_of((i, j)) != CODE_COLOR[c]))
 
+# The efficiency metrics read counters updated by the model as the robots act, not the agents
 
+# Average number of steps a robot spent without acting
 def compute_avg_time_not_working(model):
-    pass
+    return model.time_not_working / model.num_robots if model.num_robots else 0.0
 
+# Average number of cells a robot moved
 def compute_avg_distance_traveled(model):
-    pass
+    return model.distance_traveled / model.num_robots if model.num_robots else 0.0
 
+# Gini coefficient of the waste picked up per robot (0: the work is evenly shared)
 def compute_gini_coef(model):
-    pass
+    handled = np.sort(model.waste_handled_per_robot())
+    if handled.sum() == 0:
+        return 0.0
+    n = len(handled)
+    return float(2 * (np.arange(1, n + 1) * handled).sum() / (n * handled.sum()) - (n + 1) / n)
 
+# Variance of the waste picked up per robot
 def compute_variance(model):
-    pass
+    if not model.num_robots:
+        return 0.0
+    mean = model.waste_handled / model.num_robots
+    return model.waste_handled_squares / model.num_robots - mean * mean
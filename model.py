@@ -1,13 +1,24 @@
 from mesa import Model
-from mesa.space import MultiGrid
-from agents import greenAgent, yellowAgent, redAgent, Robot, CODE_COLOR, COLOR_CODE
-from objects import Radioactivity, WasteDisposalZone, Waste
-from random import random
+from mesa.agent import AgentSet
+from mesa.space import MultiGrid, PropertyLayer
+from agents import greenAgent, yellowAgent, redAgent, Robot, Blackboard, CODE_COLOR, COLOR_CODE, zone_bounds
+from objects import WasteDisposalZone, Waste
+from random import Random
+import numpy as np
 import mesa
 from metrics import *
+from profiling import PhaseProfiler
+from trajectory import TrajectoryRecorder
+from collector import MetricsCollector
+from engine import ArrayEngine, OUTCOMES, IDLE_STEPS, red_to_come, random_streams, draw_layout
+
+# order in which the actions of a synchronous step are applied, moves and NONE come last
+ACTION_ORDER = {"PICKUP": 0, "TRANSFORM": 1, "PUTDOWN": 2}
 
 class RobotMission(Model):
-    def __init__(self, n_g, n_y, n_r, n_waste, width=10, height=10, seed=None, strategy=2):
+    def __init__(self, n_g, n_y, n_r, n_waste, width=10, height=10, seed=None, strategy=2, profile=False, engine="agents",
+                 waste_storage="agents", record=None, collector="mesa", collect_every=1, spill=None,
+                 stepping="sequential"):
         super().__init__(seed=seed)
         self.width = width 
         self.height = height
@@ -15,64 +26,238 @@ class RobotMission(Model):
         self.num_yellow_agents = n_y
         self.num_red_agents = n_r
         self.num_waste = n_waste
+        self.strategy = strategy
+        self.seed = seed
+        self.disposal = (width - 1, height // 2) # cell of the waste disposal zone
         
-        self.grid = MultiGrid(width, height, torus=False)
-        
-        ## place robots
-        agent_mapping = {
-            greenAgent: self.num_green_agents,
-            yellowAgent: self.num_yellow_agents,
-            redAgent: self.num_red_agents,
-        }
-        for agent_type, num_agents in agent_mapping.items():
-            for _ in range(num_agents):
-                agent = agent_type(self, strategy)
-                self.grid.place_agent(agent, agent.knowledge.position)
+        ## radioactivity zones, stored once as a property layer (one code per cell)
+        self.zones = PropertyLayer("radioactivity", width, height, np.int8(0), dtype=np.int8)
+        for color, code in COLOR_CODE.items():
+            x_min, x_end = self.zone_bounds(color)
+            self.zones.data[x_min:x_end+1, :] = code
+        self.grid = MultiGrid(width, height, torus=False, property_layers=self.zones)
+
+        ## percepts: von Neumann neighborhood of the cells (center included) and active waste per cell and color
+        self.neighbor_offsets = np.array([0, -height, height, -1, 1], dtype=np.intp) # of a cell away from the borders
+        self.waste_counts = np.zeros((width, height, 3), dtype=np.int32)
+        self.waste_cells = self.waste_counts.reshape(-1, 3) # same counts, one row per cell x * height + y
         
-        ## place waste
-        for _ in range(self.num_waste//3):
-            agent = Waste(self, 'green')
-            self.grid.place_agent(agent, agent.position)
-        for _ in range(self.num_waste//3, 2*self.num_waste//3):
-            agent = Waste(self, 'yellow')
-            self.grid.place_agent(agent, agent.position)
-        for _ in range(2*self.num_waste//3, self.num_waste):
-            agent = Waste(self, 'red')
-            self.grid.place_agent(agent, agent.position)
-            
+        ## waste is either Mesa agents or only counted in waste_counts (waste_storage="counts"), robots then
+        ## carry the colors of their waste and Waste agents are created on demand by materialize_waste
+        if waste_storage not in ("agents", "counts"):
+            raise ValueError("Invalid waste storage. Choose 'agents' or 'counts'.")
+        self.waste_agents = waste_storage == "agents"
+        self.materialized = []
+
+        ## independent streams derived from the seed: initial layout, and order in which the robots act
+        self.layout_rng, schedule_rng = random_streams(seed)
+        self.schedule_random = Random(int(schedule_rng.integers(2**63)))
+
+        ## robots act one after the other (each one sees what the previous ones did), or plan together on
+        ## the knowledge of the start of the step before the actions are applied (stepping="synchronous")
+        if stepping not in ("sequential", "synchronous"):
+            raise ValueError("Invalid stepping. Choose 'sequential' or 'synchronous'.")
+        if engine != "agents" and stepping != "sequential":
+            raise ValueError("Stepping applies to the agents engine only.")
+        if engine != "agents" and (profile or waste_storage != "agents"):
+            raise ValueError("Profiling and waste storage apply to the agents engine only.")
+        self.synchronous = stepping == "synchronous"
+
+        ## robots and waste are either Mesa agents or NumPy arrays advanced in batches (engine="array")
+        self.engine = None
+        self.robots = AgentSet([], random=self.schedule_random)
+        self.waste_left = {'green': 0, 'yellow': 0, 'red': 0} # active waste on the grid
+        self.waste_disposed = 0
+        self.waste_carried = {'green': 0, 'yellow': 0, 'red': 0} # waste held by the working robots
+        self.acting = 0 # robots that did something during the current step
+        self.idle_steps = 0 # steps in a row without any robot acting
+        self.completion_reason = None
+        ## efficiency counters, summed over the robots as they act (see metrics.py)
+        self.num_robots = n_g + n_y + n_r
+        self.all_robots = [] # retired robots included
+        self.time_not_working = 0
+        self.distance_traveled = 0
+        self.waste_handled = 0
+        self.waste_handled_squares = 0 # sum of the squared waste handled per robot, for the variance
+        self.waste_transformed = {'green': 0, 'yellow': 0, 'red': 0}
+        if engine == "array":
+            self.blackboard = None
+            self.engine = ArrayEngine(width, height, (n_g, n_y, n_r), n_waste, strategy, seeds=[seed])
+            self.sync_engine()
+        elif engine == "agents":
+            ## knowledge shared by all robots when they communicate
+            self.blackboard = Blackboard(width, height) if strategy > 1 else None
+
+            ## place robots and waste, their positions are drawn at once (only robots are scheduled,
+            ## waste and disposal zone are passive)
+            robot_x, robot_y, waste_x, waste_y, codes = draw_layout(self.layout_rng, width, height, (n_g, n_y, n_r), n_waste)
+            robot_types = [greenAgent] * n_g + [yellowAgent] * n_y + [redAgent] * n_r
+            for agent_type, position in zip(robot_types, zip(robot_x.tolist(), robot_y.tolist())):
+                agent = agent_type(self, position, strategy)
+                self.grid.place_agent(agent, position)
+                self.robots.add(agent)
+                self.all_robots.append(agent)
+
+            ## running counters replace full-grid scans in the reporters
+            np.add.at(self.waste_counts, (waste_x, waste_y, codes), 1)
+            for color, n in zip(COLOR_CODE, np.bincount(codes, minlength=3).tolist()):
+                self.waste_left[color] += n
+            if self.waste_agents:
+                for x, y, code in zip(waste_x.tolist(), waste_y.tolist(), codes.tolist()):
+                    agent = Waste(self, CODE_COLOR[code], position=(x, y))
+                    self.grid.place_agent(agent, agent.position)
+        else:
+            raise ValueError("Invalid engine. Choose 'agents' or 'array'.")
+
         ## place waste disposal zone
         agent = WasteDisposalZone(self)
         self.grid.place_agent(agent, agent.position)
         
-        ## place radioactivity agents (with no behaviour, just to delimit the zones)
-        for x in range(width):
-            for y in range(height):
-                if x >= 0 and x <= width // 3 - 1:
-                    self.grid.place_agent(Radioactivity(self, (x,y), "green"), (x,y))
-                elif x >= width // 3  and x <= 2 * width // 3 - 1:
-                    self.grid.place_agent(Radioactivity(self, (x,y), "yellow"), (x,y))
-                else:
-                    self.grid.place_agent(Radioactivity(self, (x,y), "red"), (x,y))
-        
         ## collect useful data for our analysis later
-        self.datacollector = mesa.DataCollector(
-            model_reporters={
+        model_reporters={
         "Total_waste_disposed": compute_disposed_waste,
         "Left_waste_green": lambda m: m.count_waste("green"),
         "Left_waste_yellow": lambda m: m.count_waste("yellow"),
-        "Left_waste_red": lambda m: m.count_waste("red")
-    })
+        "Left_waste_red": lambda m: m.count_waste("red"),
+        "Avg_time_not_working": compute_avg_time_not_working,
+        "Avg_distance_traveled": compute_avg_distance_traveled,
+        "Gini_waste_handled": compute_gini_coef,
+        "Variance_waste_handled": compute_variance,
+    }
+
+        ## optional per-phase timings (nothing is wrapped when profiling is off)
+        self.profiler = None
+        if profile:
+            self.profiler = PhaseProfiler()
+            model_reporters.update(self.profiler.reporters())
+
+        ## reporters are collected by Mesa, or into NumPy columns (every collect_every steps, spilled to disk with spill)
+        if collector == "mesa":
+            self.datacollector = mesa.DataCollector(model_reporters=model_reporters)
+        elif collector == "columnar":
+            self.datacollector = MetricsCollector(model_reporters, every=collect_every, spill=spill)
+        else:
+            raise ValueError("Invalid collector. Choose 'mesa' or 'columnar'.")
+        if self.profiler is not None:
+            self.profiler.attach(self)
+
+        ## optional trajectory log (positions per step and waste events, see trajectory.py)
+        self.recorder = None
+        if record is not None:
+            self.recorder = TrajectoryRecorder(record, self)
+            self.recorder.attach(self)
         
+        self.check_completion()
         self.datacollector.collect(self)
             
     def step(self):
-        self.agents.shuffle_do("step_agent")
+        if self.engine is not None:
+            self.engine.step()
+            self.sync_engine()
+        else:
+            self.acting = 0
+            robots = len(self.robots)
+            if self.synchronous:
+                self.step_synchronous()
+            else:
+                self.robots.shuffle_do("step_agent")
+            self.acting += robots - len(self.robots) # retiring changes the mission too
+            self.idle_steps = self.idle_steps + 1 if self.acting == 0 else 0
+        self.check_completion()
         self.datacollector.collect(self)
-        
+
+    def step_synchronous(self):
+        """Sense-plan-act step: every robot deliberates on the knowledge of the start of the step, then
+        the actions are applied together, pickups first, then transformations, put downs and moves,
+        each in unique_id order (contested waste goes to the lowest unique_id), then every robot
+        perceives its new neighborhood and publishes it. Parked robots (see Robot.asleep) only rest."""
+        robots = []
+        for robot in sorted(self.robots, key=lambda robot: robot.unique_id):
+            if robot.asleep():
+                robot.sleep()
+            else:
+                robots.append(robot)
+        actions = [robot.decide() for robot in robots]
+        order = sorted(range(len(robots)), key=lambda i: ACTION_ORDER.get(actions[i], len(ACTION_ORDER)))
+        positions = [None] * len(robots)
+        for i in order:
+            positions[i] = self.act(robots[i], actions[i])
+        for robot, position in zip(robots, positions):
+            robot.update(self.perceive(robot, position))
+            if robot.terminated:
+                self.retire(robot)
+
+    def check_completion(self):
+        """Stop the model when the mission is over and record why: "disposed" when no waste is left
+        (on the grid or carried by a working robot), "retired" when every robot retired, "stranded" when
+        the waste left cannot give red waste anymore, "idle" when no robot acted for IDLE_STEPS steps
+        (nothing would change anymore). Only running counters are read."""
+        if self.engine is not None:
+            self.completion_reason = OUTCOMES[self.engine.outcome()[0]]
+        else:
+            waste = [self.waste_left[color] + self.waste_carried[color] for color in COLOR_CODE]
+            if sum(waste) == 0:
+                self.completion_reason = "disposed"
+            elif len(self.robots) == 0:
+                self.completion_reason = "retired"
+            elif red_to_come(waste) == 0:
+                self.completion_reason = "stranded"
+            elif self.idle_steps >= IDLE_STEPS:
+                self.completion_reason = "idle"
+        self.running = self.completion_reason is None
+        return self.completion_reason
+
+    def run_until_done(self, max_steps=None):
+        """Step until the mission is over or max_steps steps were run.
+        Return the last step and the completion reason (None when the step budget ran out)."""
+        while self.running and (max_steps is None or self.steps < max_steps):
+            self.step()
+        if not self.running:
+            self.close()
+        return self.steps, self.completion_reason
+
+    def close(self):
+        """Release the resources of the run: the writer of a spilling collector writes its last rows,
+        the trajectory log is closed. Stepping again restarts them."""
+        if isinstance(self.datacollector, MetricsCollector):
+            self.datacollector.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def sync_engine(self):
+        """Copy the waste counters of the array engine into the model counters read by the reporters."""
+        for color, code in COLOR_CODE.items():
+            self.waste_left[color] = int(self.engine.left[0, code])
+        self.waste_disposed = int(self.engine.disposed[0])
+        robots = slice(0, self.num_robots) # robots of the first replica
+        self.time_not_working = int(self.engine.time_not_working[robots].sum())
+        self.distance_traveled = int(self.engine.distance_traveled[robots].sum())
+        handled = self.engine.waste_handled[robots]
+        self.waste_handled = int(handled.sum())
+        self.waste_handled_squares = int((handled * handled).sum())
+        for color, code in COLOR_CODE.items():
+            self.waste_transformed[color] = int(self.engine.transformed[0, code])
+
+    def waste_handled_per_robot(self):
+        """Waste picked up by each robot, retired robots included."""
+        if self.engine is not None:
+            return self.engine.waste_handled[:self.num_robots]
+        return np.array([robot.waste_handled for robot in self.all_robots], dtype=np.int64)
+
+    def retire(self, agent:Robot):
+        """Remove a terminated robot from the schedule."""
+        self.robots.discard(agent)
+        for waste in agent.waste_carried:
+            self.waste_carried[waste.radioactivity_level if self.waste_agents else waste] -= 1
 
     def do(self, agent:Robot, action):  
         """Perform an action and return the percepts.""" 
-        
+        new_position = self.act(agent, action)
+        return self.perceive(agent, new_position)
+
+
+    def act(self, agent:Robot, action):
+        """Apply an action to the environment and return the new position of the agent."""
         new_position=None      
         x,y=agent.knowledge.position
 
@@ -95,33 +280,76 @@ class RobotMission(Model):
         elif action!="NONE":
             print('No action')
             raise Exception(f'no action {action}')
+        if action != "NONE":
+            self.acting += 1
+        else:
+            self.rest(agent)
         
-        new_position = self.move_agent(agent, new_position)
-        
-        percepts_waste = {
-                    neighbor_pos: [obj.radioactivity_level for obj in self.grid.get_cell_list_contents([neighbor_pos])
-                                   if (isinstance(obj, Waste) and obj.active)]
-                    for neighbor_pos in self.grid.get_neighborhood(new_position, moore=False, include_center=True)
-                }
-        
-        percepts_agent = [agent, new_position]
-        percepts = {'agent': percepts_agent, 'waste': percepts_waste}
+        return self.move_agent(agent, new_position)
+
+    def rest(self, agent:Robot):
+        """Count a step where a robot does nothing."""
+        agent.time_not_working += 1
+        self.time_not_working += 1
+
+
+    def perceive(self, agent:Robot, new_position):
+        """Build the percepts of an agent at its new position: the cells of its neighborhood
+        (as x * height + y) and the number of active waste of each color lying on them."""
+        cells = self.neighborhood(new_position)
+        percepts = {'agent': [agent, new_position], 'waste': (cells, self.waste_cells.take(cells, axis=0))}
         return percepts
 
+    def neighborhood(self, position):
+        """Cells x * height + y of the von Neumann neighborhood of a cell, center included."""
+        x, y = position
+        if 0 < x < self.width - 1 and 0 < y < self.height - 1:
+            return x * self.height + y + self.neighbor_offsets
+        return np.array([(x+dx) * self.height + y+dy for dx, dy in ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1))
+                         if 0 <= x+dx < self.width and 0 <= y+dy < self.height], dtype=np.intp)
+
+
+    def zone_bounds(self, color):
+        """Return the (x_min, x_end) columns delimiting the zone of a given color."""
+        return zone_bounds(self.width, color)
+
+    def zone_of(self, pos):
+        """Return the color of the zone containing a given cell."""
+        return CODE_COLOR[int(self.zones.data[pos])]
 
     def get_all_agents_positions(self):
         return [a.knowledge.position for a in self.agents]
     
     
+    def place_waste(self, waste, position):
+        """Place a newly created waste on the grid and count it if it lies on the ground."""
+        self.grid.place_agent(waste, position)
+        if waste.active:
+            self.count_waste_at(waste.radioactivity_level, position)
+
+    def count_waste_at(self, color, position):
+        """Count a waste lying on the ground."""
+        self.waste_left[color] += 1
+        self.waste_counts[position][COLOR_CODE[color]] += 1
+
+
     def putdown(self, agent):
         """Put down a waste on the grid."""
-        if len(agent.waste_carried)>=1:
-            waste = agent.waste_carried[0]
+        if len(agent.waste_carried)==0:
+            return
+        waste = agent.waste_carried[0]
+        color = waste.radioactivity_level if self.waste_agents else waste
+        if self.waste_agents:
             waste.active=True
-            agent.putdown(waste)
+        agent.putdown(waste)
+        self.waste_carried[color] -= 1
         
-        if agent.pos==(self.width-1, self.height//2):
-            self.grid.remove_agent(waste)
+        if agent.pos==self.disposal:
+            if self.waste_agents:
+                self.grid.remove_agent(waste)
+            self.waste_disposed += 1
+        else:
+            self.count_waste_at(color, agent.pos)
 
 
     def move_agent(self, agent, new_position):
@@ -129,8 +357,11 @@ class RobotMission(Model):
         if new_position in agent.get_possible_moves():
             self.grid.move_agent(agent, new_position)
             agent.knowledge.position=new_position
-            for obj in agent.waste_carried:
-                self.grid.move_agent(obj, new_position)
+            agent.distance_traveled += 1
+            self.distance_traveled += 1
+            if self.waste_agents:
+                for obj in agent.waste_carried:
+                    self.grid.move_agent(obj, new_position)
         else:
             new_position=agent.knowledge.position
         return new_position
@@ -138,30 +369,66 @@ class RobotMission(Model):
 
     def pickup(self, agent):
         """Pick up waste if available in the current cell."""
-        contents = self.grid.get_cell_list_contents([agent.knowledge.position])
-        waste = [w for w in contents if isinstance(w, Waste) and w.radioactivity_level==agent.color and w.active]
-        if len(waste)>0 and agent.available:
-            agent.pickup(waste[0])
-            waste[0].active=False
+        position = agent.knowledge.position
+        code = COLOR_CODE[agent.color]
+        if self.waste_counts[position][code] == 0 or not agent.available:
+            return
+        if self.waste_agents:
+            contents = self.grid.get_cell_list_contents([position])
+            waste = next(w for w in contents if isinstance(w, Waste) and w.radioactivity_level==agent.color and w.active)
+            waste.active=False
+            agent.pickup(waste)
+        else:
+            agent.pickup(agent.color)
+        self.waste_left[agent.color] -= 1
+        self.waste_carried[agent.color] += 1
+        self.waste_counts[position][code] -= 1
+        agent.waste_handled += 1
+        self.waste_handled += 1
+        self.waste_handled_squares += 2 * agent.waste_handled - 1
 
 
     def transform(self, agent):
         """Transform waste according to the transformation rule: 2green=1yellow and 2yellow=1red."""
         assert len(agent.waste_carried)==2
-        for w in agent.waste_carried:
-            assert w.radioactivity_level==agent.color
-            if w.pos is not None:
-                self.grid.remove_agent(w)
-        new_waste = Waste(self, CODE_COLOR[1 + COLOR_CODE[agent.color]])
-        self.grid.place_agent(new_waste, agent.knowledge.position)
+        color = CODE_COLOR[1 + COLOR_CODE[agent.color]]
+        if self.waste_agents:
+            for w in agent.waste_carried:
+                assert w.radioactivity_level==agent.color
+                if w.pos is not None:
+                    self.grid.remove_agent(w)
+            new_waste = Waste(self, color, position=agent.knowledge.position)
+            new_waste.active = False # carried until it is put down
+            self.place_waste(new_waste, agent.knowledge.position)
+        else:
+            new_waste = color
         agent.transform(new_waste)
+        self.waste_carried[agent.color] -= 2
+        self.waste_carried[color] += 1
+        self.waste_transformed[agent.color] += 2
+
+
+    def materialize_waste(self):
+        """Create the Waste agents of the waste stored as counts (on the ground and carried), e.g. to
+        draw them. They are replaced at each call and take no part in the mission."""
+        if self.waste_agents:
+            return
+        for waste in self.materialized:
+            self.grid.remove_agent(waste)
+            waste.remove()
+        self.materialized = []
+        for x, y, code in zip(*np.nonzero(self.waste_counts)):
+            for _ in range(self.waste_counts[x, y, code]):
+                self.materialized.append(Waste(self, CODE_COLOR[int(code)], position=(int(x), int(y))))
+        for robot in self.robots:
+            for color in robot.waste_carried:
+                waste = Waste(self, color, position=robot.knowledge.position)
+                waste.active = False
+                self.materialized.append(waste)
+        for waste in self.materialized:
+            self.grid.place_agent(waste, waste.position)
 
 
     def count_waste(self, color):
-        """Count the number of waste agents of a specific color in the grid."""
-        count = 0
-        for contents, (x, y) in self.grid.coord_iter():
-            for agent in contents:
-                if isinstance(agent, Waste) and agent.radioactivity_level == color and agent.active:
-                    count += 1
-        return count
\ No newline at end of file
+        """Count the number of waste agents of a specific color lying on the grid."""
+        return self.waste_left[color]
\ No newline at end of file
@@ -0,0 +1,77 @@
+import time
+from functools import wraps
+
+import pandas as pd
+
+COLORS = ("green", "yellow", "red")
+ROBOT_PHASES = ("deliberate", "act", "percepts", "update")
+MODEL_PHASES = ("collect",)
+
+
+class PhaseProfiler:
+    """Accumulates wall time and call counts of each phase of the agent step cycle, per robot color.
+
+    Phases: deliberate (Robot.deliberate), act (RobotMission.act), percepts (RobotMission.perceive),
+    update (Robot.update, i.e. publishing to the blackboard) and collect (DataCollector.collect).
+    The methods are wrapped on the instances by attach(), so a model built without profiling runs
+    the original code."""
+    def __init__(self):
+        self.time = {(phase, color): 0.0 for phase in ROBOT_PHASES for color in COLORS}
+        self.calls = {(phase, color): 0 for phase in ROBOT_PHASES for color in COLORS}
+        for phase in MODEL_PHASES:
+            self.time[(phase, "model")] = 0.0
+            self.calls[(phase, "model")] = 0
+
+    def _timed(self, function, phase, color=None):
+        """Wrap function so that its calls are accounted to (phase, color).
+        Without a color, the color of the robot passed as first argument is used."""
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            key = (phase, color or args[0].color)
+            self.time[key] += time.perf_counter() - start
+            self.calls[key] += 1
+            return result
+        return wrapper
+
+    def attach(self, model):
+        """Instrument the model, its datacollector and its robots."""
+        for robot in model.robots:
+            robot.deliberate = self._timed(robot.deliberate, "deliberate", robot.color)
+            robot.update = self._timed(robot.update, "update", robot.color)
+        model.act = self._timed(model.act, "act")
+        model.perceive = self._timed(model.perceive, "percepts")
+        model.datacollector.collect = self._timed(model.datacollector.collect, "collect", "model")
+
+    def reporters(self):
+        """Model reporters of the cumulated time (in seconds) of each phase and color."""
+        return {
+            f"Profile_{phase}_{color}_s": (lambda m, key=(phase, color): self.time[key])
+            for phase, color in self.time
+        }
+
+    def summary(self):
+        """Table of the calls, total and mean time of each phase and color."""
+        total = sum(self.time.values()) or 1.0
+        rows = [
+            {
+                "phase": phase,
+                "color": color,
+                "calls": self.calls[(phase, color)],
+                "total_s": self.time[(phase, color)],
+                "mean_us": 1e6 * self.time[(phase, color)] / max(self.calls[(phase, color)], 1),
+                "share": self.time[(phase, color)] / total,
+            }
+            for phase, color in self.time
+        ]
+        return pd.DataFrame(rows)
+
+    def report(self):
+        """Human readable summary, slowest phases first."""
+        summary = self.summary().sort_values("total_s", ascending=False)
+        lines = [f"{'phase':<12}{'color':<8}{'calls':>10}{'total (s)':>12}{'mean (us)':>12}{'share':>8}"]
+        for row in summary.itertuples():
+            lines.append(f"{row.phase:<12}{row.color:<8}{row.calls:>10}{row.total_s:>12.3f}"
+                         f"{row.mean_us:>12.1f}{row.share:>8.1%}")
+        return "\n".join(lines)
@@ -1,21 +1,29 @@
+import os
+import time
+import threading
+import numpy as np
 import solara
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from mesa.visualization import make_space_component, SolaraViz
 from mesa.visualization.utils import update_counter
 from model import RobotMission
 from agents import greenAgent, yellowAgent, redAgent
-from objects import Radioactivity, WasteDisposalZone, Waste
+from objects import WasteDisposalZone, Waste
+from trajectory import Trajectory
+from metrics import count_waste_handed_over
 from matplotlib.ticker import MaxNLocator
     
     
+## Visualisation des zones (couche "radioactivity" du modèle, codes 0/1/2)
+zone_portrayal = {
+    "radioactivity": {"colormap": ["#C7F6C7", "#FFFDD0", "#F19396"], "vmin": 0, "vmax": 2, "colorbar": False}
+}
+
 ## Visualisation des agents
 def agent_portrayal(agent): 
     
-    if isinstance(agent, Radioactivity):
-        color = {"green": "#C7F6C7", "yellow": "#FFFDD0", "red": "#F19396"}[agent.color]
-        return {"size": 1100, "color": color, "marker": "s", "zorder": 0}
-    
-    elif isinstance(agent, (greenAgent, yellowAgent, redAgent)):
+    if isinstance(agent, (greenAgent, yellowAgent, redAgent)):
         color_map = {
             greenAgent: "#00C000",
             yellowAgent: "#F6C324",
@@ -28,7 +36,9 @@ def agent_portrayal(agent):
     elif isinstance(agent, Waste):
         
         color = {"green": "#2FF924", "yellow": "#AC9F3C", "red": "#EB212E"}[agent.radioactivity_level]
-        return {"size": 60, "color": color, "marker": "s", "zorder": 1}
+        # déchet déposé à la limite d'une zone, en attente de l'équipe suivante : bordure noire
+        edge = "black" if agent.model.zone_of(agent.pos) != agent.radioactivity_level else color
+        return {"size": 60, "color": color, "marker": "s", "zorder": 1, "edgecolors": edge}
     else:
         raise Exception(f"Unknown Object {type(agent)}")
 
@@ -37,54 +47,120 @@ def agent_portrayal(agent):
 
 
 
-## Courbe de suivi des déchets
+## Budget d'affichage des courbes, indépendant de la vitesse de la simulation
+PLOT_FRAME_RATE = 4 # images par seconde au plus pour chaque courbe
+PLOT_MAX_POINTS = 1000 # au-delà, les séries sont sous-échantillonnées
+
+
+## Courbe réutilisée d'une variable du datacollector
+class SeriesPlot:
+    """Figure created once per model: new values are appended to the series and the figure is
+    redrawn at most PLOT_FRAME_RATE times per second, with at most PLOT_MAX_POINTS points."""
+    def __init__(self, name, title, label, line_color, integer=True):
+        self.name = name
+        self.values = []
+        self.drawn = 0 # points shown on the last frame
+        self.last_frame = 0.0
+        self.frame = 0
+        self.fig = Figure()
+        self.ax = self.fig.subplots()
+        self.line, = self.ax.plot([], [], label=label, color=line_color, linewidth=3.5)
+        self.ax.set_title(title, fontsize=30)
+        self.ax.set_xlabel("Step")
+        self.ax.set_ylabel("Quantité")
+        self.ax.tick_params(axis='both', labelsize=20)
+        if integer:
+            self.ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+            self.ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+        self.ax.legend()
+        self.ax.grid(True)
+
+    def update(self, model):
+        """Append the values collected since the last call, redraw if the frame budget allows it
+        (or if the mission is over). Return the number of the current frame."""
+        collected = model.datacollector.model_vars.get(self.name, [])
+        self.values.extend(collected[len(self.values):])
+        now = time.monotonic()
+        if len(self.values) == self.drawn or (model.running and now - self.last_frame < 1 / PLOT_FRAME_RATE):
+            return self.frame
+        steps = np.arange(len(self.values))
+        stride = -(-len(self.values) // PLOT_MAX_POINTS)
+        shown = np.union1d(steps[::stride], steps[-1:]) # the last point is always shown
+        self.line.set_data(shown, np.asarray(self.values)[shown])
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.drawn = len(self.values)
+        self.last_frame = now
+        self.frame += 1
+        return self.frame
+
+    def wait(self):
+        """Seconds before the values held back by the frame budget can be drawn, None if all are drawn."""
+        if len(self.values) == self.drawn:
+            return None
+        return max(0.0, self.last_frame + 1 / PLOT_FRAME_RATE - time.monotonic())
+
+
 @solara.component
-def WasteSinglePlot(model, color: str, label: str, line_color: str):
+def SeriesFigure(model, name, title, label, line_color, integer=True):
     
     update_counter.get()
     if model is None:
         return solara.Text("Modèle non chargé.")
-    
-    df = model.datacollector.get_model_vars_dataframe()
-    if df.empty or f"Left_waste_{color}" not in df.columns:
+    plot = solara.use_memo(lambda: SeriesPlot(name, title, label, line_color, integer), [model])
+    _, set_flushes = solara.use_state(0)
+    frame = plot.update(model)
+
+    # les points retenus par le budget (lecture en pause ou arrêtée) sont dessinés par un rendu différé
+    def flush_later():
+        delay = plot.wait()
+        if delay is None:
+            return None
+        timer = threading.Timer(delay, lambda: set_flushes(lambda n: n + 1))
+        timer.start()
+        return timer.cancel
+    solara.use_effect(flush_later, [plot, len(plot.values), plot.drawn])
+    if frame == 0:
         return solara.Text(f"Pas encore de données pour {label}.")
+    return solara.FigureMatplotlib(plot.fig, dependencies=[frame], format="png")
 
-    fig, ax = plt.subplots()
-    ax.plot(df.index, df[f"Left_waste_{color}"], label=label, color=line_color,linewidth=3.5)
-    ax.set_title(f"{label} over time",fontsize=30)
-    ax.set_xlabel("Step")
-    ax.set_ylabel("Quantité")
-    ax.tick_params(axis='both', labelsize=20)
-    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
-    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-    ax.legend()
-    ax.grid(True)
 
-    return solara.FigureMatplotlib(fig)
+## Courbe de suivi des déchets
+@solara.component
+def WasteSinglePlot(model, color: str, label: str, line_color: str):
+    
+    return SeriesFigure(model, f"Left_waste_{color}", f"{label} over time", label, line_color)
 
 
 ## Courbe de suivi du déchet neutralisé
 @solara.component
 def WasteDisposedPlot(model):
     
+    return SeriesFigure(model, "Total_waste_disposed", "Total_waste_disposed", "Disposed", "black", integer=False)
+
+## Etat de la mission (la lecture s'arrête d'elle-même quand model.running passe à False)
+@solara.component
+def MissionStatus(model):
+    
     update_counter.get()
     if model is None:
-        return solara.Text("Modèle non chargé.")
-
-    df = model.datacollector.get_model_vars_dataframe()
-    if df.empty or "Total_waste_disposed" not in df.columns:
-        return solara.Text("Pas encore de données.")
+        return solara.Text("Mission en cours.")
+    if model.running:
+        return solara.Text(f"Mission en cours, {count_waste_handed_over(model)} déchet(s) en attente aux limites des zones.")
+    return solara.Markdown(f"**Mission terminée à l'étape {model.steps}** ({model.completion_reason}).")
 
-    fig, ax = plt.subplots()
-    ax.plot(df.index, df["Total_waste_disposed"], label="Disposed", color="black",linewidth=3.5)
-    ax.set_title("Total_waste_disposed",fontsize=30)
-    ax.set_xlabel("Step")
-    ax.set_ylabel("Quantité")
-    ax.tick_params(axis='both', labelsize=20)
-    ax.legend()
-    ax.grid(True)
+## Indicateurs d'efficacité (lus dans les compteurs du modèle, dernière valeur collectée)
+EFFICIENCY_METRICS = ["Avg_time_not_working", "Avg_distance_traveled", "Gini_waste_handled", "Variance_waste_handled"]
 
-    return solara.FigureMatplotlib(fig)
+@solara.component
+def EfficiencyStatus(model):
+    
+    update_counter.get()
+    if model is None:
+        return solara.Text("")
+    collected = model.datacollector.model_vars
+    return solara.Markdown(" \n".join(f"{name}: {collected[name][-1]:.2f}" for name in EFFICIENCY_METRICS
+                                       if len(collected.get(name, []))))
 
 ## Plot de suivi des 4 métriques
 @solara.component
@@ -101,10 +177,36 @@ def WastePlotsAll(model):
             WasteDisposedPlot(model)
        
 
+## Relecture d'une trajectoire enregistrée (ROBOT_REPLAY=<dossier> solara run server.py)
+REPLAY_PATH = os.environ.get("ROBOT_REPLAY")
+
+@solara.component
+def ReplayPage(path):
+    
+    trajectory = solara.use_memo(lambda: Trajectory(path), [path])
+    step = solara.use_reactive(0)
+    model = solara.use_memo(lambda: trajectory.restore(step.value), [step.value])
+    metrics = solara.use_memo(trajectory.metrics, [])
+    
+    plt.rcParams["figure.figsize"] = (7, 7)  
+    SpaceGraph = make_space_component(agent_portrayal, propertylayer_portrayal=zone_portrayal)
+    model.materialize_waste()
+
+    with solara.Columns([3, 9]):
+        with solara.Column():
+            solara.Markdown(f"### Replay of `{path}`")
+            solara.SliderInt("step", value=step, min=0, max=trajectory.steps)
+            solara.Markdown(" \n".join(f"{name}: {metrics[name].iloc[step.value]}" for name in metrics.columns))
+        with solara.Column():
+            SpaceGraph(model)
+
+
 ## Page principale avec panneau gauche customisé
 @solara.component
 def Page():
     
+    if REPLAY_PATH:
+        return ReplayPage(REPLAY_PATH)
     n_g = solara.use_reactive(1)
     n_y = solara.use_reactive(1)
     n_r = solara.use_reactive(1)
@@ -123,7 +225,14 @@ def Page():
     ), [n_g.value, n_y.value, n_r.value, n_waste.value, 12, 12])
     
     plt.rcParams["figure.figsize"] = (7, 7)  
-    SpaceGraph = make_space_component(agent_portrayal)
+    SpaceGraph = make_space_component(agent_portrayal, propertylayer_portrayal=zone_portrayal)
+
+    # les déchets stockés en comptes (waste_storage="counts") sont créés comme agents juste avant l'affichage
+    @solara.component
+    def WasteSpaceGraph(model):
+        update_counter.get()
+        model.materialize_waste()
+        return SpaceGraph(model)
 
     with solara.Columns([3, 9]):
         with solara.Column():
@@ -138,6 +247,6 @@ def Page():
             SolaraViz(
                 model,
                 model_params={key: val.value for key, val in model_params.items()},
-                components=[SpaceGraph, WastePlotsAll],
+                components=[WasteSpaceGraph, MissionStatus, EfficiencyStatus, WastePlotsAll],
                 name="Self-organization of Robots in a Hostile Environment",
             )
\ No newline at end of file
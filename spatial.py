@@ -0,0 +1,267 @@
+from bisect import bisect_left, bisect_right, insort
+
+import numpy as np
+
+
+class ColumnIndex:
+    """Set of grid cells bucketed by column, answering nearest-cell queries (Manhattan distance)
+    without scanning the whole grid. Ties are broken like np.argwhere followed by np.argmin:
+    smallest x first, then smallest y. Subclasses store the cells and provide _below(x, y) and
+    _above(x, y), the largest y' <= y and smallest y' >= y of the column x in the set (None if none)."""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.columns = [] # sorted x of the non-empty columns
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _column_nearest(self, x, y0, exclude):
+        """Nearest cell of the column x to the row y0 (smallest y on ties)."""
+        below = self._below(x, y0)
+        while below is not None and (x, below) in exclude:
+            below = self._below(x, below - 1)
+        above = self._above(x, y0)
+        while above is not None and (x, above) in exclude:
+            above = self._above(x, above + 1)
+        if below is None:
+            return above
+        if above is None or y0 - below <= above - y0:
+            return below
+        return above
+
+    def nearest(self, pos, x_range=None, exclude=()):
+        """Nearest cell of the set to pos, restricted to the columns x_range=(x_min, x_end)."""
+        x0, y0 = pos
+        x_min, x_end = x_range if x_range is not None else (0, self.width - 1)
+        columns = self.columns
+        left_stop = bisect_left(columns, x_min)
+        right_stop = bisect_right(columns, x_end)
+        pivot = bisect_right(columns, x0) # columns[:pivot] are on the left of x0 (or on it)
+        left = min(pivot, right_stop) - 1
+        right = max(pivot, left_stop)
+        best = None # (distance, x, y)
+        while left >= left_stop or right < right_stop:
+            # visit the columns by increasing horizontal distance, left one first on ties
+            if right >= right_stop or (left >= left_stop and x0 - columns[left] <= columns[right] - x0):
+                x = columns[left]
+                left -= 1
+            else:
+                x = columns[right]
+                right += 1
+            dx = abs(x - x0)
+            if best is not None and dx > best[0]:
+                break
+            y = self._column_nearest(x, y0, exclude)
+            if y is None:
+                continue
+            candidate = (dx + abs(y - y0), x, y)
+            if best is None or candidate < best:
+                best = candidate
+        if best is None:
+            return None
+        return best[1], best[2]
+
+
+class TargetIndex(ColumnIndex):
+    """Sparse set of cells (e.g. known waste of one color), stored as sorted rows per column."""
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.rows = {} # x -> sorted list of y
+
+    @classmethod
+    def from_cells(cls, width, height, xs, ys):
+        """Set of the cells (xs, ys), given in any order."""
+        index = cls(width, height)
+        order = np.lexsort((ys, xs))
+        xs, ys = np.asarray(xs)[order], np.asarray(ys)[order]
+        columns, starts = np.unique(xs, return_index=True)
+        for x, rows in zip(columns.tolist(), np.split(ys, starts[1:])):
+            index.rows[x] = rows.tolist()
+        index.columns = columns.tolist()
+        index.size = len(xs)
+        return index
+
+    def __contains__(self, cell):
+        rows = self.rows.get(cell[0])
+        if not rows:
+            return False
+        i = bisect_left(rows, cell[1])
+        return i < len(rows) and rows[i] == cell[1]
+
+    def add(self, x, y):
+        """Adds a cell, returns whether the set changed."""
+        rows = self.rows.get(x)
+        if rows is None:
+            rows = self.rows[x] = []
+            insort(self.columns, x)
+        i = bisect_left(rows, y)
+        if i < len(rows) and rows[i] == y:
+            return False
+        rows.insert(i, y)
+        self.size += 1
+        return True
+
+    def discard(self, x, y):
+        """Removes a cell, returns whether the set changed."""
+        rows = self.rows.get(x)
+        if rows is None:
+            return False
+        i = bisect_left(rows, y)
+        if i == len(rows) or rows[i] != y:
+            return False
+        del rows[i]
+        self.size -= 1
+        if not rows:
+            del self.rows[x]
+            self.columns.remove(x)
+        return True
+
+    def cells(self):
+        """All the cells of the set, in (x, y) order."""
+        return [(x, y) for x in self.columns for y in self.rows[x]]
+
+    def _below(self, x, y):
+        rows = self.rows[x]
+        i = bisect_right(rows, y)
+        return rows[i - 1] if i > 0 else None
+
+    def _above(self, x, y):
+        rows = self.rows[x]
+        i = bisect_left(rows, y)
+        return rows[i] if i < len(rows) else None
+
+
+class UnknownIndex(ColumnIndex):
+    """Dense set of cells (the unexplored part of the grid), stored as sorted intervals of rows
+    per column, so memory follows the frontier of the explored area rather than the grid area.
+    Only the explored columns are stored, the others are entirely unknown."""
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.columns = range(width) # a list once a column is fully explored
+        self.starts = {} # x -> sorted interval starts, for the explored columns
+        self.ends = {} # x -> matching interval ends
+        self.whole = ([0], [height - 1]) # intervals of a column never explored, not modified
+        self.size = width * height
+
+    @classmethod
+    def from_known(cls, width, height, xs, ys):
+        """Set of the cells of the grid that are not among the known cells (xs, ys), in any order."""
+        index = cls(width, height)
+        order = np.lexsort((ys, xs))
+        xs, ys = np.asarray(xs)[order], np.asarray(ys)[order]
+        columns, first = np.unique(xs, return_index=True)
+        for x, rows in zip(columns.tolist(), np.split(ys, first[1:])):
+            bounds = np.concatenate(([-1], np.unique(rows), [height]))
+            gaps = np.flatnonzero(np.diff(bounds) > 1)
+            index.starts[x] = (bounds[gaps] + 1).tolist()
+            index.ends[x] = (bounds[gaps + 1] - 1).tolist()
+            index.size -= len(bounds) - 2
+        explored = [x for x in columns.tolist() if not index.starts[x]]
+        if explored:
+            index.columns = sorted(set(range(width)).difference(explored))
+        return index
+
+    def _intervals(self, x):
+        starts = self.starts.get(x)
+        if starts is None:
+            return self.whole
+        return starts, self.ends[x]
+
+    def __contains__(self, cell):
+        x, y = cell
+        starts, ends = self._intervals(x)
+        i = bisect_right(starts, y) - 1
+        return i >= 0 and y <= ends[i]
+
+    def discard(self, x, y):
+        """Marks a cell as explored, returns whether it was unknown."""
+        starts, ends = self._intervals(x)
+        i = bisect_right(starts, y) - 1
+        if i < 0 or y > ends[i]:
+            return False
+        if starts is self.whole[0]:
+            starts, ends = self.starts[x], self.ends[x] = list(starts), list(ends)
+        start, end = starts[i], ends[i]
+        if start == end:
+            del starts[i], ends[i]
+            if not starts:
+                if isinstance(self.columns, range):
+                    self.columns = list(self.columns)
+                self.columns.remove(x)
+        elif y == start:
+            starts[i] = y + 1
+        elif y == end:
+            ends[i] = y - 1
+        else:
+            ends[i] = y - 1
+            starts.insert(i + 1, y + 1)
+            ends.insert(i + 1, end)
+        self.size -= 1
+        return True
+
+    def _below(self, x, y):
+        starts, ends = self._intervals(x)
+        i = bisect_right(starts, y) - 1
+        if i < 0:
+            return None
+        return min(y, ends[i])
+
+    def _above(self, x, y):
+        starts, ends = self._intervals(x)
+        i = bisect_right(starts, y) - 1
+        if i >= 0 and y <= ends[i]:
+            return y
+        return starts[i + 1] if i + 1 < len(starts) else None
+
+
+class TiledMap:
+    """Waste counts per cell and color of a width x height grid (int8, -1 while the cell is unknown),
+    stored as square tiles of 2**shift cells a side allocated at the first write: memory follows the
+    observed area. Cells are numbered like the rows of a (width * height, 3) array: x * height + y.
+    The cells of a percept are few, they are read and written one by one from Python."""
+    def __init__(self, width, height, shift=6):
+        self.width = width
+        self.height = height
+        self.shift = min(shift, (max(width, height) - 1).bit_length()) # no larger than the grid
+        self.mask = (1 << self.shift) - 1
+        self.tiles = {} # (tx, ty) -> counts of the cells of the tile, one row per cell u * side + v
+        self.unknown = [-1, -1, -1] # counts of a cell never observed, not modified
+
+    def take(self, cells):
+        """Counts of the cells (list of cell numbers), one list per cell."""
+        shift, mask, tiles = self.shift, self.mask, self.tiles
+        rows = []
+        for cell in cells:
+            x, y = divmod(cell, self.height)
+            tile = tiles.get((x >> shift, y >> shift))
+            rows.append(self.unknown if tile is None else tile[((x & mask) << shift) | (y & mask)].tolist())
+        return rows
+
+    def put(self, cell, counts):
+        """Writes the counts of a cell, allocating its tile if needed."""
+        x, y = divmod(cell, self.height)
+        key = (x >> self.shift, y >> self.shift)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = np.full((1 << 2 * self.shift, 3), -1, dtype=np.int8)
+        tile[((x & self.mask) << self.shift) | (y & self.mask)] = counts
+
+    def get_tiles(self):
+        """Allocated tiles: their (tx, ty) positions and contents (side x side x 3 each)."""
+        side = self.mask + 1
+        keys = np.array(list(self.tiles), dtype=np.int64).reshape(-1, 2)
+        if not self.tiles:
+            return keys, np.zeros((0, side, side, 3), dtype=np.int8)
+        return keys, np.stack(list(self.tiles.values())).reshape(-1, side, side, 3)
+
+    def load(self, keys, tiles):
+        """Replaces the map by tiles (e.g. restored from a checkpoint), see get_tiles."""
+        self.tiles = {(tx, ty): tile.reshape(-1, 3).copy() for (tx, ty), tile in zip(keys.tolist(), tiles)}
+
+    def known(self):
+        """Cells observed at least once: their x, y and counts."""
+        keys, tiles = self.get_tiles()
+        k, u, v = np.nonzero(tiles[:, :, :, 0] >= 0)
+        return (keys[k, 0] << self.shift) + u, (keys[k, 1] << self.shift) + v, tiles[k, u, v]
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from agents import Blackboard, TeamAssignment, COLOR_CODE, zone_bounds
+
+
+def target_is_free(board, color, unique_id, nearest_target, distance_self, index, x_range=None):
+    """Per-robot check of the strategy 3 claims, as done before TeamAssignment."""
+    for agent_id, position in board.available_agents_pos[color].items():
+        if position is None:
+            continue
+        distance_other_agent = abs(position[0] - nearest_target[0]) + abs(position[1] - nearest_target[1])
+        if (distance_self > distance_other_agent) \
+                or (distance_self == distance_other_agent and unique_id < agent_id):
+            if index.nearest(position, x_range) == nearest_target:
+                return False
+    return True
+
+
+def get_free_target(board, color, unique_id, position, index, x_range=None):
+    """Nearest cell of the index that no teammate with priority is heading to, one robot at a time."""
+    x, y = position
+    tried = set()
+    while True:
+        nearest_target = index.nearest((x, y), x_range, tried)
+        if nearest_target is None:
+            return None
+        distance = abs(nearest_target[0] - x) + abs(nearest_target[1] - y)
+        if target_is_free(board, color, unique_id, nearest_target, distance, index, x_range):
+            return nearest_target
+        tried.add(nearest_target)
+
+
+def random_board(rng, width, height, color, n_robots, n_targets, explored):
+    """Board with random targets of a color, explored cells and robots of that color (some unavailable)."""
+    board = Blackboard(width, height)
+    code = COLOR_CODE[color]
+    for x, y in zip(rng.integers(0, width, n_targets).tolist(), rng.integers(0, height, n_targets).tolist()):
+        board.known_targets[code].add(x, y)
+    for cell in rng.choice(width * height, int(explored * width * height), replace=False).tolist():
+        board.unknown.discard(*divmod(cell, height))
+    robots = []
+    for unique_id in rng.choice(1000, n_robots, replace=False).tolist():
+        position = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        board.available_agents_pos[color][unique_id] = position if rng.random() < 0.8 else None
+        robots.append(SimpleNamespace(unique_id=unique_id, knowledge=SimpleNamespace(position=position)))
+    return board, robots
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_claims_match_per_robot_loop(seed):
+    rng = np.random.default_rng(seed)
+    width, height = int(rng.integers(6, 40)), int(rng.integers(3, 30))
+    color = ("green", "yellow", "red")[seed % 3]
+    board, robots = random_board(rng, width, height, color, int(rng.integers(1, 25)), int(rng.integers(0, 40)),
+                                 rng.random())
+    assignment = TeamAssignment(board, color, tick=0)
+    index = board.known_targets[COLOR_CODE[color]]
+    x_range = zone_bounds(width, color)
+    for robot in robots:
+        position = robot.knowledge.position
+        assert assignment.target_for(robot) == get_free_target(board, color, robot.unique_id, position, index)
+        assert assignment.exploratory_target_for(robot, x_range) \
+            == get_free_target(board, color, robot.unique_id, position, board.unknown, x_range)
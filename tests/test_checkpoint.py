@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+import pytest
+
+from model import RobotMission
+from checkpoint import Checkpoint, snapshot, restore
+
+
+def assert_same(expected, actual):
+    assert expected.arrays.keys() == actual.arrays.keys()
+    for name, values in expected.arrays.items():
+        assert values.dtype == actual.arrays[name].dtype, name
+        assert np.array_equal(values, actual.arrays[name]), name
+    assert json.dumps(expected.state) == json.dumps(actual.state) # as saved
+
+
+@pytest.mark.parametrize("strategy", [1, 2, 3])
+@pytest.mark.parametrize("engine, waste_storage", [("agents", "agents"), ("agents", "counts"), ("array", "agents")])
+def test_restored_run_is_identical(tmp_path, engine, waste_storage, strategy):
+    model = RobotMission(4, 4, 4, 60, 21, 21, seed=3, strategy=strategy, engine=engine, waste_storage=waste_storage)
+    for _ in range(60):
+        model.step()
+    path = tmp_path / "checkpoint.npz"
+    snapshot(model).save(path)
+    for _ in range(60):
+        model.step()
+    expected = snapshot(model)
+
+    # the saved state continues exactly as the original run
+    restored = restore(Checkpoint.load(path))
+    assert_same(Checkpoint.load(path), snapshot(restored))
+    for _ in range(60):
+        restored.step()
+    assert_same(expected, snapshot(restored))
+    assert restored.datacollector.get_model_vars_dataframe().equals(model.datacollector.get_model_vars_dataframe())
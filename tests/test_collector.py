@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+
+from collector import ChunkedColumn, MetricsCollector
+from model import RobotMission
+
+
+def test_spilled_columns_read_like_the_buffer(tmp_path):
+    expected = RobotMission(5, 5, 5, 30, 20, 20, seed=1, collector="columnar")
+    model = RobotMission(5, 5, 5, 30, 20, 20, seed=1, collector="columnar", spill=tmp_path)
+    model.datacollector = MetricsCollector(model.datacollector.model_reporters, chunk_size=7, spill=tmp_path)
+    expected.datacollector = MetricsCollector(expected.datacollector.model_reporters)
+    for _ in range(40):
+        expected.step()
+        model.step()
+
+    values = expected.datacollector.column("Total_waste_disposed")
+    column = model.datacollector.column("Total_waste_disposed")
+    assert isinstance(column, ChunkedColumn)
+    assert len(column) == len(values) == 40
+    assert np.array_equal(np.asarray(column), values)
+    assert column[3] == values[3] and column[-1] == values[-1]
+    for index in (slice(5, 20), slice(13, 14), slice(30, None), slice(None, None, 3), slice(None, None, -2), slice(20, 10)):
+        assert np.array_equal(column[index], values[index]), index
+    assert model.datacollector.get_model_vars_dataframe().equals(expected.datacollector.get_model_vars_dataframe())
+
+    # the last rows are written when the run is closed
+    model.close()
+    assert model.datacollector.writer is None and model.datacollector.size == 0
+    assert len(os.listdir(tmp_path / "Step")) == 6
+    assert np.array_equal(np.asarray(model.datacollector.column("Step")), np.arange(1, 41))
@@ -0,0 +1,81 @@
+import random
+
+import numpy as np
+import pytest
+
+from agents import Robot
+from ensemble import RobotEnsemble
+from model import RobotMission
+from trajectory import Trajectory
+
+
+def trajectory(model, steps):
+    """Position and load of every robot after each step, then the reporters of the run."""
+    positions = []
+    for _ in range(steps):
+        model.step()
+        positions.append([(robot.unique_id, robot.pos, len(robot.waste_carried)) for robot in model.all_robots])
+    return positions, model.datacollector.get_model_vars_dataframe()
+
+
+@pytest.mark.parametrize("strategy", [2, 3])
+@pytest.mark.parametrize("stepping", ["sequential", "synchronous"])
+def test_parked_robots_do_not_change_the_run(monkeypatch, stepping, strategy):
+    asleep = Robot.asleep
+    parked = []
+    monkeypatch.setattr(Robot, "asleep", lambda self: parked.append(asleep(self)) or parked[-1])
+    expected = trajectory(RobotMission(4, 4, 4, 40, 21, 21, seed=5, strategy=strategy, stepping=stepping), 150)
+    # with strategy 2 a robot with nothing left to do terminates rather than parks
+    assert any(parked) == (strategy == 3)
+
+    monkeypatch.setattr(Robot, "asleep", lambda self: False)
+    positions, dataframe = trajectory(RobotMission(4, 4, 4, 40, 21, 21, seed=5, strategy=strategy, stepping=stepping), 150)
+    assert positions == expected[0]
+    assert dataframe.equals(expected[1])
+
+
+@pytest.mark.parametrize("engine", ["agents", "array"])
+def test_seed_reproduces_the_run(engine):
+    runs = []
+    for state in (0, 1):
+        random.seed(state)
+        np.random.seed(state)
+        model = RobotMission(3, 3, 3, 30, 15, 15, seed=7, engine=engine)
+        model.run_until_done(200)
+        runs.append(model.datacollector.get_model_vars_dataframe())
+    assert runs[0].equals(runs[1])
+
+
+@pytest.mark.parametrize("strategy", [1, 2, 3])
+def test_replica_follows_the_single_run(strategy):
+    seeds = [0, 1, 2]
+    ensemble = RobotEnsemble(3, 3, 3, 30, 15, 15, seeds=seeds, strategy=strategy)
+    ensemble.run(300)
+    series = ensemble.series()
+    for i, seed in enumerate(seeds):
+        model = RobotMission(3, 3, 3, 30, 15, 15, seed=seed, strategy=strategy, engine="array")
+        steps, reason = model.run_until_done(300)
+        assert ensemble.completion[i] == (steps if reason is not None else -1)
+        assert ensemble.reasons()[i] == reason
+        dataframe = model.datacollector.get_model_vars_dataframe()
+        for name, values in series.items():
+            assert np.array_equal(values[:steps + 1, i], dataframe[name].to_numpy()), name
+
+
+def test_close_closes_the_trajectory_log(tmp_path):
+    model = RobotMission(3, 3, 3, 20, 12, 12, seed=2, record=tmp_path / "run.traj")
+    steps, reason = model.run_until_done(300)
+    assert reason is not None and model.recorder.positions.closed and model.recorder.events_file.closed
+    # stepping again appends to the log
+    model.step()
+    model.close()
+    trajectory = Trajectory(tmp_path / "run.traj")
+    assert trajectory.steps == steps + 1
+    assert trajectory.metrics().equals(model.datacollector.get_model_vars_dataframe()[trajectory.metrics().columns])
+
+
+def test_zone_of_matches_the_zone_bounds():
+    model = RobotMission(1, 1, 1, 3, 17, 5, seed=0)
+    for color in ("green", "yellow", "red"):
+        x_min, x_end = model.zone_bounds(color)
+        assert all(model.zone_of((x, y)) == color for x in range(x_min, x_end + 1) for y in range(5))
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+from agents import COLOR_CODE, CODE_COLOR
+
+# events of the log
+PICKUP, TRANSFORM, PUTDOWN, DISPOSE, RETIRE = range(5)
+EVENT = np.dtype([("step", "<i4"), ("robot", "<i4"), ("kind", "i1"), ("color", "i1"), ("x", "<i2"), ("y", "<i2")])
+POSITION = np.dtype("<i2")
+
+
+class TrajectoryRecorder:
+    """Append-only log of a run, written in a directory:
+    header.json (parameters, robots), waste.npy (waste on the ground at step 0), positions.bin
+    (x, y of every robot after each collected step, int16) and events.bin (pickups, transformations,
+    put downs, disposals and retirements, EVENT records). Like PhaseProfiler, the recorder wraps
+    methods of the model instance, so a model that is not recorded runs the original code."""
+    def __init__(self, path, model):
+        if model.engine is not None:
+            raise ValueError("Trajectories are recorded with the agents engine only.")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.model = model
+        self.robots = list(model.robots)
+        self.index = {robot.unique_id: i for i, robot in enumerate(self.robots)}
+        self.events = []
+        header = {
+            "width": model.width,
+            "height": model.height,
+            "strategy": model.strategy,
+            "seed": model.seed,
+            "n_robots": [model.num_green_agents, model.num_yellow_agents, model.num_red_agents],
+            "robot_ids": [robot.unique_id for robot in self.robots],
+            "robot_colors": [COLOR_CODE[robot.color] for robot in self.robots],
+        }
+        with open(os.path.join(path, "header.json"), "w") as f:
+            json.dump(header, f, indent=2)
+        np.save(os.path.join(path, "waste.npy"), model.waste_counts)
+        self.open("wb")
+
+    def open(self, mode):
+        self.positions = open(os.path.join(self.path, "positions.bin"), mode)
+        self.events_file = open(os.path.join(self.path, "events.bin"), mode)
+
+    def attach(self, model):
+        """Instrument the actions of the model and its data collection."""
+        model.pickup = self._recorded(model.pickup, self.carried, self.on_pickup)
+        model.transform = self._recorded(model.transform, None, self.on_transform)
+        model.putdown = self._recorded(model.putdown, self.carried, self.on_putdown)
+        model.retire = self._recorded(model.retire, None, self.on_retire)
+        model.datacollector.collect = self._recorded(model.datacollector.collect, None, self.on_collect)
+
+    def _recorded(self, function, before, after):
+        """Wrap function so that after(state, *args) runs after it, state being before(*args)
+        computed before the call (None without before)."""
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            state = before(*args) if before is not None else None
+            result = function(*args, **kwargs)
+            after(state, *args)
+            return result
+        return wrapper
+
+    def event(self, robot, kind, color):
+        x, y = robot.knowledge.position
+        self.events.append((self.model.steps, self.index[robot.unique_id], kind, color, x, y))
+
+    def carried(self, robot):
+        """Waste carried by a robot before an action: their number, the color of the first one."""
+        if not robot.waste_carried:
+            return 0, None
+        waste = robot.waste_carried[0]
+        return len(robot.waste_carried), getattr(waste, "radioactivity_level", waste)
+
+    def on_pickup(self, before, robot):
+        if len(robot.waste_carried) > before[0]:
+            self.event(robot, PICKUP, COLOR_CODE[robot.color])
+
+    def on_transform(self, before, robot):
+        self.event(robot, TRANSFORM, COLOR_CODE[robot.color] + 1)
+
+    def on_putdown(self, before, robot):
+        carried, color = before
+        if len(robot.waste_carried) < carried:
+            # waste put down on the disposal zone is removed at once
+            kind = DISPOSE if robot.knowledge.position == self.model.disposal else PUTDOWN
+            self.event(robot, kind, COLOR_CODE[color])
+
+    def on_retire(self, before, robot):
+        self.event(robot, RETIRE, COLOR_CODE[robot.color])
+
+    def on_collect(self, before, model):
+        if self.positions.closed:
+            # the model was closed and is stepped again
+            self.open("ab")
+        positions = np.array([robot.knowledge.position for robot in self.robots], dtype=POSITION)
+        self.positions.write(positions.tobytes())
+        if self.events:
+            self.events_file.write(np.array(self.events, dtype=EVENT).tobytes())
+            self.events = []
+        # readers see every collected step
+        self.positions.flush()
+        self.events_file.flush()
+
+    def close(self):
+        """Close the log files; the next collected step reopens them."""
+        self.positions.close()
+        self.events_file.close()
+
+
+class Trajectory:
+    """Recorded run, read through memory maps. Any step can be rebuilt and the reporters recomputed
+    from the log without running the agents."""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as f:
+            self.header = json.load(f)
+        self.waste = np.load(os.path.join(path, "waste.npy"))
+        self.colors = np.array(self.header["robot_colors"], dtype=np.int64)
+        self.positions = self._map("positions.bin", POSITION).reshape(-1, len(self.colors), 2)
+        self.events = self._map("events.bin", EVENT)
+
+    def _map(self, name, dtype):
+        filename = os.path.join(self.path, name)
+        if os.path.getsize(filename) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode="r")
+
+    @property
+    def steps(self):
+        """Last recorded step."""
+        return len(self.positions) - 1
+
+    def state(self, step):
+        """Waste on the ground (W x H x 3), waste carried per robot and color, retired robots
+        and waste disposed of after a given step."""
+        events = self.events[:np.searchsorted(self.events["step"], step, side="right")]
+        kind, robot, color = events["kind"], events["robot"], events["color"].astype(np.int64)
+        waste = self.waste.copy()
+        sign = np.where(kind == PUTDOWN, 1, -1)
+        ground = (kind == PICKUP) | (kind == PUTDOWN)
+        np.add.at(waste, (events["x"][ground], events["y"][ground], color[ground]), sign[ground])
+
+        carried = np.zeros((len(self.colors), 3), dtype=np.int64)
+        moves = kind != RETIRE
+        delta = np.where(kind == PICKUP, 1, np.where(kind == TRANSFORM, 1, -1))
+        np.add.at(carried, (robot[moves], color[moves]), delta[moves])
+        transform = kind == TRANSFORM
+        np.add.at(carried, (robot[transform], self.colors[robot[transform]]), -2)
+        retired = np.zeros(len(self.colors), dtype=bool)
+        retired[robot[kind == RETIRE]] = True
+        return waste, carried, retired, int((kind == DISPOSE).sum())
+
+    def metrics(self):
+        """The reporters of RobotMission (Total_waste_disposed, Left_waste_<color>) at every step."""
+        events = self.events
+        steps = len(self.positions)
+        series = {"Total_waste_disposed": np.cumsum(np.bincount(events["step"][events["kind"] == DISPOSE],
+                                                                minlength=steps))}
+        for color, code in COLOR_CODE.items():
+            of_color = events["color"] == code
+            put = np.bincount(events["step"][of_color & (events["kind"] == PUTDOWN)], minlength=steps)
+            picked = np.bincount(events["step"][of_color & (events["kind"] == PICKUP)], minlength=steps)
+            series[f"Left_waste_{color}"] = self.waste[:, :, code].sum() + np.cumsum(put - picked)
+        return pd.DataFrame({name: values[:steps] for name, values in series.items()})
+
+    def restore(self, step):
+        """RobotMission showing the recorded state of a step (robots, waste on the ground and carried),
+        e.g. for the visualization. No agent logic is run and the model does not step further."""
+        from model import RobotMission
+
+        header = self.header
+        model = RobotMission(*header["n_robots"], 0, header["width"], header["height"],
+                             strategy=header["strategy"], waste_storage="counts")
+        waste, carried, retired, disposed = self.state(step)
+        for robot, position, waste_carried, gone in zip(list(model.robots), self.positions[step].tolist(),
+                                                        carried.tolist(), retired):
+            position = tuple(position)
+            model.grid.move_agent(robot, position)
+            robot.knowledge.position = position
+            robot.waste_carried = [CODE_COLOR[code] for code, n in enumerate(waste_carried) for _ in range(n)]
+            robot.available = not robot.waste_carried or (robot.color != "red" and robot.waste_carried == [robot.color])
+            if gone:
+                model.grid.remove_agent(robot)
+                model.robots.discard(robot)
+        model.waste_counts[:] = waste
+        for color, code in COLOR_CODE.items():
+            model.waste_left[color] = int(waste[:, :, code].sum())
+            model.waste_carried[color] = int(carried[~retired, code].sum())
+        model.waste_disposed = disposed
+        model.steps = step
+        model.running = False
+        return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a recorded RobotMission trajectory.")
+    parser.add_argument("path", help="directory written by RobotMission(..., record=path)")
+    parser.add_argument("--step", type=int, help="print the state of this step")
+    parser.add_argument("--metrics", help="write the reporters of every step to this CSV file")
+    args = parser.parse_args()
+
+    trajectory = Trajectory(args.path)
+    print(f"{trajectory.steps} steps, {len(trajectory.colors)} robots, {len(trajectory.events)} events")
+    if args.step is not None:
+        waste, carried, retired, disposed = trajectory.state(args.step)
+        print(f"step {args.step}: waste on the ground {dict(zip(COLOR_CODE, waste.sum(axis=(0, 1)).tolist()))}, "
+              f"carried {dict(zip(COLOR_CODE, carried[~retired].sum(axis=0).tolist()))}, disposed {disposed}, "
+              f"retired robots {int(retired.sum())}")
+    if args.metrics:
+        trajectory.metrics().to_csv(args.metrics, index_label="Step")
+        print(f"metrics written to {args.metrics}")
+
+
+if __name__ == "__main__":
+    main()